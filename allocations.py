@@ -0,0 +1,107 @@
+import gc
+import tracemalloc
+from backends import begin_headless_run, end_headless_run
+
+ALLOC_SAVE = "level1_saved"
+TICKS = 1000
+WARMUP_TICKS = 300  # lets the first cars reach the bridge before measuring
+SPAWN_EVERY = 150
+# the means measured on level1_saved with drawn ticks when the budgets were
+# set, headless ticks stay below them. the bytes left behind include the
+# state of the cars that are still driving when the measurement ends
+MEASURED_TICK_BYTES = 3813  # held at once within a tick beyond its start
+MEASURED_RETAINED_BYTES = 109  # left allocated per tick
+# containers a drawn tick adds to generation 0, mostly the draw batches of
+# force colors seen for the first time. python collects once 700 pile up
+MEASURED_GC_OBJECTS = 0.235
+# headroom for noise and small changes, a real regression goes beyond it
+MARGIN = 1.5
+TICK_BUDGET = round(MEASURED_TICK_BYTES * MARGIN)
+RETAINED_BUDGET = round(MEASURED_RETAINED_BYTES * MARGIN)
+GC_BUDGET = round(MEASURED_GC_OBJECTS * MARGIN, 3)
+
+
+def measure_allocations(game, save_name=ALLOC_SAVE, ticks=TICKS,
+                        warmup=WARMUP_TICKS, spawn_every=SPAWN_EVERY,
+                        draw=False):
+    """
+    runs a savegame headless with a steady stream of pooled cars and traces
+    the python allocations of every simulation tick
+    :param game:
+    :param save_name:
+    :param ticks: measured ticks
+    :param warmup: ticks run before measuring
+    :param spawn_every: ticks between spawned cars
+    :param draw: draw every tick like the interactive game does
+    :return: dict with the mean and largest bytes allocated within a tick
+        beyond what was allocated at its start, the bytes left allocated per
+        tick, the garbage collections during the measured ticks and the
+        containers per tick added to generation 0, which is what triggers
+        them
+    """
+    from cars import Car
+    begin_headless_run(game, save_name)
+    Car.prewarm((warmup + ticks) // spawn_every + 1)
+    collections = []
+    collected_counts = []  # generation 0 counts emptied by collections
+    tick_bytes = []
+
+    def count_collection(phase, info):
+        if phase == "start":
+            collections.append(info["generation"])
+            collected_counts.append(gc.get_count()[0])
+
+    # traced from the start, values set while untraced would otherwise show
+    # up as new memory once they are replaced
+    tracemalloc.start()
+    for tick in range(warmup + ticks):
+        if tick == warmup:
+            gc.collect()  # the measured ticks start from an empty generation
+            gc.callbacks.append(count_collection)
+            first = tracemalloc.get_traced_memory()[0]
+        if tick % spawn_every == 0:
+            Car.spawn((game.window.right + 100, game.window.centery))
+        if tick >= warmup:
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        game.step((0, 0), draw=draw)
+        if tick >= warmup:
+            tick_bytes.append(tracemalloc.get_traced_memory()[1] - start)
+    last = tracemalloc.get_traced_memory()[0]
+    gc.callbacks.remove(count_collection)
+    gc_objects = sum(collected_counts) + gc.get_count()[0]
+    tracemalloc.stop()
+    end_headless_run(game)
+    return {"save": save_name, "ticks": ticks, "draw": draw,
+            "mean_tick_bytes": round(sum(tick_bytes) / ticks, 1),
+            "max_tick_bytes": max(tick_bytes),
+            "retained_bytes": round((last - first) / ticks, 1),
+            "collections": len(collections),
+            "gc_objects": round(gc_objects / ticks, 3)}
+
+
+def check_allocations(result, tick_budget=TICK_BUDGET,
+                      retained_budget=RETAINED_BUDGET, gc_budget=GC_BUDGET):
+    """
+    checks a measurement against the allocation budget, any garbage
+    collection during the measured ticks fails it
+    :param result: dict returned by measure_allocations
+    :param tick_budget: limit of the mean bytes allocated within a tick
+    :param retained_budget: limit of the bytes left allocated per tick
+    :param gc_budget: limit of the containers per tick added to generation 0
+    :return: list of problems, empty if the run stayed within budget
+    """
+    problems = []
+    if result["mean_tick_bytes"] > tick_budget:
+        problems.append(f"ticks allocate {result['mean_tick_bytes']} bytes "
+                        f"on average (limit {tick_budget})")
+    if result["retained_bytes"] > retained_budget:
+        problems.append(f"ticks keep {result['retained_bytes']} bytes "
+                        f"allocated (limit {retained_budget})")
+    if result["collections"] > 0:
+        problems.append(f"{result['collections']} garbage collections ran "
+                        f"during the ticks")
+    if result["gc_objects"] > gc_budget:
+        problems.append(f"ticks add {result['gc_objects']} containers to the "
+                        f"garbage collector (limit {gc_budget})")
+    return problems
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+import pygame
+
+
+class AssetManager:
+    """
+    loads images on first use and keeps the converted surfaces in a least
+    recently used cache capped by memory, decoded pixels can also be stored
+    in a disk cache so the png files only get decoded once
+    """
+    CACHE_DIR = ".asset_cache"
+    HEADER = struct.Struct("<4s4sII")  # magic, pixel format, width, height
+    MAGIC = b"MXA2"  # bumped whenever the header or pixel layout changes
+    DEF_FONT = "freesansbold.ttf"
+    fonts = {}
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, use_disk_cache=True):
+        """
+        creates an empty asset manager, images are only loaded when requested
+        :param max_bytes: memory cap for the converted surfaces kept in cache
+        :param use_disk_cache: whether to store raw decoded pixels on disk
+        """
+        self.max_bytes = max_bytes
+        self.use_disk_cache = use_disk_cache
+        self.images = OrderedDict()
+        self.curr_bytes = 0
+
+    @staticmethod
+    def surface_size(surface):
+        """
+        returns the approximate number of bytes a surface takes in memory
+        :param surface:
+        :return:
+        """
+        return surface.get_width() * surface.get_height() * \
+            surface.get_bytesize()
+
+    def get_image(self, file_name, alpha=False):
+        """
+        returns a converted surface of the image, decoding it only if it is
+        not already cached
+        :param file_name:
+        :param alpha: convert with per pixel alpha
+        :return:
+        """
+        key = (file_name, alpha)
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key]
+        surface = self.load_image(file_name)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha() if alpha else surface.convert()
+        self.images[key] = surface
+        self.curr_bytes += self.surface_size(surface)
+        self.evict()
+        return surface
+
+    @classmethod
+    def get_font(cls, size, font_name=DEF_FONT):
+        """
+        returns a font shared by all ui elements, fonts are created the first
+        time a given size is requested
+        :param size:
+        :param font_name:
+        :return:
+        """
+        key = (font_name, size)
+        if key not in AssetManager.fonts:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            AssetManager.fonts[key] = pygame.font.Font(font_name, size)
+        return AssetManager.fonts[key]
+
+    def preload(self, *file_names):
+        """
+        loads images ahead of time so later screen changes do not have to
+        decode anything
+        :param file_names:
+        :return:
+        """
+        for file_name in file_names:
+            self.get_image(file_name)
+
+    def evict(self):
+        """
+        drops the least recently used surfaces until the cache fits in its
+        memory cap, always keeps at least the most recent one
+        :return:
+        """
+        while self.curr_bytes > self.max_bytes and len(self.images) > 1:
+            _, surface = self.images.popitem(last=False)
+            self.curr_bytes -= self.surface_size(surface)
+
+    def clear(self):
+        """
+        empties the in-memory cache
+        :return:
+        """
+        self.images.clear()
+        self.curr_bytes = 0
+
+    def cache_path(self, file_name):
+        """
+        returns the disk cache path for an image. the name holds a hash of the
+        source's full path, size and mtime in nanoseconds, so edited images
+        and images of the same name in other directories are decoded again,
+        and the magic so entries of an older cache format are never read
+        :param file_name:
+        :return:
+        """
+        stat = os.stat(file_name)
+        source = f"{os.path.abspath(file_name)}|{stat.st_size}|" \
+                 f"{stat.st_mtime_ns}"
+        key = hashlib.sha1(source.encode()).hexdigest()[:16]
+        base = os.path.basename(file_name).replace(".", "_")
+        version = AssetManager.MAGIC.decode().lower()
+        return os.path.join(AssetManager.CACHE_DIR,
+                            f"{base}_{key}_{version}.raw")
+
+    def load_image(self, file_name):
+        """
+        loads an unconverted surface, from the disk cache if possible,
+        otherwise decodes the file and stores its raw pixels in the cache
+        :param file_name:
+        :return:
+        """
+        if not self.use_disk_cache:
+            return pygame.image.load(file_name)
+        path = self.cache_path(file_name)
+        try:
+            with open(path, "rb") as f:
+                magic, raw_format, width, height = AssetManager.HEADER.unpack(
+                    f.read(AssetManager.HEADER.size))
+                if magic == AssetManager.MAGIC:
+                    return pygame.image.frombuffer(
+                        f.read(), (width, height),
+                        raw_format.decode().strip())
+        except (OSError, ValueError, struct.error):
+            pass
+        surface = pygame.image.load(file_name)
+        self.store_raw(surface, path)
+        return surface
+
+    def store_raw(self, surface, path):
+        """
+        writes the raw pixel data of a surface into the disk cache, failures
+        are not critical since the png can always be decoded again
+        :param surface:
+        :param path:
+        :return:
+        """
+        if surface.get_flags() & pygame.SRCALPHA:
+            raw_format = "RGBA"
+        else:
+            raw_format = "RGB"
+        try:
+            os.makedirs(AssetManager.CACHE_DIR, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(AssetManager.HEADER.pack(
+                    AssetManager.MAGIC, raw_format.ljust(4).encode(),
+                    *surface.get_size()))
+                f.write(pygame.image.tobytes(surface, raw_format))
+            os.replace(tmp_path, path)
+        except OSError as exception:
+            print(f"Error writing asset cache: {exception}")
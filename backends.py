@@ -0,0 +1,440 @@
+import math
+import time
+import phys
+from phys import Beam, Node
+from constants import *
+
+try:
+    import numpy as np
+except ImportError:  # only the reference backend works without numpy
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class PhysicsBackend:
+    """
+    interface of a physics backend, it covers force accumulation in beams,
+    integration of nodes and wheel collisions. batched backends compute the
+    forces of all beams and integrate all nodes in one call each, the sprite
+    updates then only do bookkeeping and drawing. the methods here are the
+    reference behaviour, the per-object physics of phys.py run in a loop
+    """
+    name = None
+    batched = False
+
+    def accumulate_forces(self, beams):
+        """
+        computes the force of every active beam and adds it to its nodes, the
+        beam's dx, dy, curr_length, F_total, Fx and Fy are updated as well
+        :param beams:
+        :return:
+        """
+        for beam in beams:
+            beam.dx = abs(beam.node1.x - beam.node2.x)
+            beam.dy = abs(beam.node1.y - beam.node2.y)
+            if beam.dx != 0 or beam.dy != 0:  # preventing div by 0 errors
+                beam.update_physics()
+
+    def integrate(self, nodes, delta_t):
+        """
+        integrates the velocities and positions of the nodes from their
+        forces and then resets the forces for the next tick
+        :param nodes:
+        :param delta_t:
+        :return:
+        """
+        decay = Node.step_decay(delta_t)
+        for node in nodes:
+            if not node.anchored:
+                node.update_physics(delta_t, decay)
+            node.reset_forces()
+
+    @staticmethod
+    def collide(beam, wheel):
+        """
+        collides a wheel node with a paved beam, returns True on contact
+        :param beam:
+        :param wheel:
+        :return:
+        """
+        return beam.collide_beam(wheel)
+
+
+class PythonBackend(PhysicsBackend):
+    """
+    the reference backend, the original per-object physics of phys.py. it is
+    not batched, the beam and node sprites update themselves every tick
+    """
+    name = "python"
+    batched = False
+    collide = staticmethod(Beam.collide_beam)
+
+
+class NumpyBackend(PhysicsBackend):
+    """
+    vectorized backend, gathers the state of all beams and nodes into arrays
+    once per tick, computes forces and integration with array operations and
+    writes the results back. the arithmetic follows the reference backend
+    operation by operation
+    """
+    name = "numpy"
+    batched = True
+
+    def accumulate_forces(self, beams):
+        count = len(beams)
+        if count == 0:
+            return
+        nodes = {}
+        ends = []
+        for beam in beams:
+            ends.append(nodes.setdefault(beam.node1, len(nodes)))
+            ends.append(nodes.setdefault(beam.node2, len(nodes)))
+        ends = np.array(ends).reshape(count, 2)
+        node_list = list(nodes)
+        node_x = np.array([node.x for node in node_list])
+        node_y = np.array([node.y for node in node_list])
+        node_fx = np.array([node.Fx for node in node_list], float)
+        node_fy = np.array([node.Fy for node in node_list], float)
+        props = np.array([(beam.base_length, beam.k_tens, beam.k_comp)
+                          for beam in beams], float)
+        results = self.beam_forces(node_x, node_y, node_fx, node_fy, ends,
+                                   props[:, 0], props[:, 1], props[:, 2])
+        dx, dy, length, force, fx, fy = results
+        for i, beam in enumerate(beams):
+            beam.dx = dx[i]
+            beam.dy = dy[i]
+            beam.curr_length = length[i]
+            beam.F_total = force[i]
+            beam.Fx = fx[i]
+            beam.Fy = fy[i]
+        for i, node in enumerate(node_list):
+            node.Fx = node_fx[i]
+            node.Fy = node_fy[i]
+
+    @staticmethod
+    def beam_forces(node_x, node_y, node_fx, node_fy, ends, base_length,
+                    k_tens, k_comp):
+        """
+        array version of Beam.update_physics, node forces are accumulated
+        in beam order like in the reference backend
+        :return: (dx, dy, curr_length, F_total, Fx, Fy) arrays of the beams
+        """
+        x1 = node_x[ends[:, 0]]
+        x2 = node_x[ends[:, 1]]
+        y1 = node_y[ends[:, 0]]
+        y2 = node_y[ends[:, 1]]
+        dx = np.abs(x1 - x2)
+        dy = np.abs(y1 - y2)
+        length = np.sqrt(dx ** 2 + dy ** 2)
+        force = np.abs(base_length - length) * np.where(
+            base_length > length, k_comp, k_tens)
+        fx = force * dx / (dx + dy)
+        fy = force - fx
+        sign_x = np.where(x1 > x2, -1.0, 1.0)
+        sign_y = np.where(y1 > y2, -1.0, 1.0)
+        # interleaving both ends keeps the reference accumulation order
+        np.add.at(node_fx, ends.ravel(),
+                  np.stack((sign_x * fx, -sign_x * fx), 1).ravel())
+        np.add.at(node_fy, ends.ravel(),
+                  np.stack((sign_y * fy, -sign_y * fy), 1).ravel())
+        return dx, dy, length, force, fx, fy
+
+    def integrate(self, nodes, delta_t):
+        count = len(nodes)
+        if count == 0:
+            return
+        state = np.array([(node.x, node.y, node.vx, node.vy, node.Fx,
+                           node.Fy, node.mass, node.damp_factor,
+                           node.anchored, node.collideable_with_game_window)
+                          for node in nodes], float)
+        window = Node.game.window
+        bounds = np.array((window.left, window.right, window.top,
+                           window.bottom, Node.DEL_RANGE), float)
+        results = self.integrate_nodes(state, delta_t, bounds)
+        x, y, vx, vy, prev_x, prev_y, ftx, fty, delete = results
+        for i, node in enumerate(nodes):
+            if not node.anchored:
+                node.x = x[i]
+                node.y = y[i]
+                node.vx = vx[i]
+                node.vy = vy[i]
+                node.prev_x = prev_x[i]
+                node.prev_y = prev_y[i]
+                node.Ftx = ftx[i]
+                node.Fty = fty[i]
+                if delete[i]:
+                    node.delete_node()
+            node.reset_forces()
+
+    @staticmethod
+    def integrate_nodes(state, delta_t, bounds):
+        """
+        array version of Node.update_physics for the non-anchored nodes
+        :return: (x, y, vx, vy, prev_x, prev_y, Ftx, Fty, delete) arrays
+        """
+        x, y, vx, vy, fx, fy, mass, damp, anchored, window_coll = state.T
+        free = anchored == 0
+        ftx = vx * np.abs(vx) * damp
+        fty = vy * np.abs(vy) * damp
+        decay = Node.step_decay(delta_t)
+        vx = np.where(np.abs(ftx) > np.abs(fx), vx * decay,
+                      vx + (fx - ftx) / mass * delta_t)
+        vy = np.where(np.abs(fty) > np.abs(fy), vy * decay,
+                      vy + (fy - fty) / mass * delta_t)
+        vx = np.where(vx < 0.01, vx * decay, vx)
+        vy = np.where(vy < 0.01, vy * decay, vy)
+        prev_x = x
+        prev_y = y
+        x = x + vx * delta_t
+        y = y + vy * delta_t
+        left, right, top, bottom, del_range = bounds
+        coll = (window_coll != 0) & free
+        hit = coll & (x < left)
+        x = np.where(hit, left, x)
+        vx = np.where(hit, vx * -0.5, vx)
+        hit = coll & ~hit & (x > right)
+        x = np.where(hit, right, x)
+        vx = np.where(hit, vx * -0.5, vx)
+        hit = coll & (y > bottom)
+        y = np.where(hit, bottom, y)
+        vy = np.where(hit, vy * -0.5, vy)
+        hit = coll & (y < top)
+        y = np.where(hit, top, y)
+        vy = np.where(hit, vy * -0.5, vy)
+        delete = ~coll & free & ((x > right + del_range) |
+                                 (x < left - del_range) |
+                                 (y > bottom + del_range) |
+                                 (y < top - del_range))
+        return x, y, vx, vy, prev_x, prev_y, ftx, fty, delete
+
+
+def _beam_forces_loop(node_x, node_y, node_fx, node_fy, ends, base_length,
+                      k_tens, k_comp):
+    """
+    loop version of NumpyBackend.beam_forces for numba to compile
+    """
+    count = ends.shape[0]
+    dx = np.empty(count)
+    dy = np.empty(count)
+    length = np.empty(count)
+    force = np.empty(count)
+    fx = np.empty(count)
+    fy = np.empty(count)
+    for i in range(count):
+        a = ends[i, 0]
+        b = ends[i, 1]
+        dx[i] = abs(node_x[a] - node_x[b])
+        dy[i] = abs(node_y[a] - node_y[b])
+        length[i] = math.sqrt(dx[i] ** 2 + dy[i] ** 2)
+        if base_length[i] > length[i]:
+            force[i] = abs(base_length[i] - length[i]) * k_comp[i]
+        else:
+            force[i] = abs(base_length[i] - length[i]) * k_tens[i]
+        fx[i] = force[i] * dx[i] / (dx[i] + dy[i])
+        fy[i] = force[i] - fx[i]
+        if node_x[a] > node_x[b]:
+            node_fx[a] -= fx[i]
+            node_fx[b] += fx[i]
+        else:
+            node_fx[a] += fx[i]
+            node_fx[b] -= fx[i]
+        if node_y[a] > node_y[b]:
+            node_fy[a] -= fy[i]
+            node_fy[b] += fy[i]
+        else:
+            node_fy[a] += fy[i]
+            node_fy[b] -= fy[i]
+    return dx, dy, length, force, fx, fy
+
+
+class NumbaBackend(NumpyBackend):
+    """
+    the numpy backend with its force kernel compiled by numba, only
+    available when numba is installed
+    """
+    name = "numba"
+    batched = True
+
+    def __init__(self):
+        self.beam_forces = numba.njit(cache=True)(_beam_forces_loop)
+
+
+def available_backends():
+    """
+    returns the names of the backends that can run with the installed
+    packages
+    :return:
+    """
+    names = [PythonBackend.name]
+    if np is not None:
+        names.append(NumpyBackend.name)
+        if numba is not None:
+            names.append(NumbaBackend.name)
+    return names
+
+
+def get_backend(name):
+    """
+    creates a backend by name
+    :param name:
+    :return:
+    """
+    if name not in available_backends():
+        raise ValueError(f"physics backend '{name}' is not available, "
+                         f"possible: {available_backends()}")
+    for backend in (PythonBackend, NumpyBackend, NumbaBackend):
+        if backend.name == name:
+            return backend()
+
+
+def begin_headless_run(game, save_name):
+    """
+    loads a savegame and switches it straight to simulation, without the
+    level's own car schedule
+    :param game:
+    :param save_name:
+    :return:
+    """
+    from cars import Car
+    game.load_game(save_name, wait=True)
+    Car.recycle_all()
+    Node.is_gravity_on = True
+    Node.is_frozen = False
+    game.gamemode = "simulation"
+    game.update_death_toll(0, True)
+
+
+def end_headless_run(game):
+    """
+    returns the game to the builder after begin_headless_run
+    :param game:
+    :return:
+    """
+    from cars import Car
+    Car.recycle_all()
+    Node.is_gravity_on = False
+    Node.is_frozen = True
+    game.gamemode = "builder"
+    game.update_death_toll(0, True)
+
+
+def run_trajectory(game, save_name, ticks, spawn_every, sample_every):
+    """
+    runs a savegame headless with the game's current backend and a fixed car
+    schedule
+    :param game:
+    :param save_name:
+    :param ticks:
+    :param spawn_every: ticks between spawned cars
+    :param sample_every: ticks between position samples
+    :return: dict with the sampled positions of the saved structure's nodes
+        (NaN once a node is gone), the failure tick of every saved beam (None
+        if it held), the death toll and the time the run took
+    """
+    from cars import Car
+    begin_headless_run(game, save_name)
+    nodes = list(Node.nodes)
+    beams = Beam.beams.tagged("saved").sprites()
+    failures = {}
+    samples = []
+    start = time.perf_counter()
+    for tick in range(ticks):
+        if tick % spawn_every == 0:
+            Car.spawn((game.window.right + 100, game.window.centery))
+        game.step((0, 0), draw=False)
+        for beam in beams:
+            if beam not in failures and beam.breaking != 0:
+                failures[beam] = tick
+        if tick % sample_every == 0:
+            samples.append([(node.x, node.y) if node.alive()
+                            else (math.nan, math.nan) for node in nodes])
+    duration = time.perf_counter() - start
+    result = {"positions": np.array(samples, float).reshape(
+                  len(samples), len(nodes), 2),
+              "failures": [failures.get(beam) for beam in beams],
+              "deaths": game.death_toll,
+              "seconds": duration}
+    end_headless_run(game)
+    return result
+
+
+def trajectory_divergence(positions_a, positions_b):
+    """
+    compares two sampled trajectories of the same nodes, a node that exists
+    in only one of them counts as infinitely far away
+    :param positions_a: array of (samples, nodes, 2)
+    :param positions_b: array of (samples, nodes, 2)
+    :return: array with the largest node distance of every sample
+    """
+    distance = np.sqrt(((positions_a - positions_b) ** 2).sum(axis=2))
+    distance = np.where(np.isnan(positions_a).any(axis=2) !=
+                        np.isnan(positions_b).any(axis=2), np.inf, distance)
+    return np.nan_to_num(distance, nan=0).max(axis=1, initial=0)
+
+
+def cross_validate(game, save_name, backend_a, backend_b, ticks=2000,
+                   spawn_every=300, sample_every=10):
+    """
+    runs the same savegame with two backends and reports how far apart their
+    node trajectories end up
+    :param game:
+    :param save_name:
+    :param backend_a: backend name
+    :param backend_b: backend name
+    :param ticks:
+    :param spawn_every:
+    :param sample_every:
+    :return: dict with the divergence statistics
+    """
+    runs = []
+    for name in (backend_a, backend_b):
+        game.set_backend(get_backend(name))
+        runs.append(run_trajectory(game, save_name, ticks, spawn_every,
+                                   sample_every))
+    run_a, run_b = runs
+    per_sample = trajectory_divergence(run_a["positions"], run_b["positions"])
+    diverged = np.nonzero(per_sample > 1)[0]
+    return {"save": save_name,
+            "backends": (backend_a, backend_b),
+            "ticks": ticks,
+            "max_divergence": float(per_sample.max(initial=0)),
+            "final_divergence": float(per_sample[-1]) if len(per_sample)
+            else 0.0,
+            "first_tick_over_1px": int(diverged[0] * sample_every)
+            if len(diverged) else None,
+            "failures_match": run_a["failures"] == run_b["failures"],
+            "deaths": (run_a["deaths"], run_b["deaths"]),
+            "seconds": (run_a["seconds"], run_b["seconds"])}
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    parser = argparse.ArgumentParser(
+        description="runs a savegame with two physics backends and compares "
+                    "the trajectories of its nodes")
+    parser.add_argument("save", help="name of a savegame in savegames/")
+    parser.add_argument("backends", nargs="*",
+                        default=[PythonBackend.name, NumpyBackend.name],
+                        help="the two backends to compare")
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--spawn-every", type=int, default=300,
+                        help="ticks between spawned cars")
+    args = parser.parse_args()
+    if len(args.backends) != 2:
+        parser.error("exactly two backends are compared")
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from cars import Car
+    from game_handler import Game
+    from ui_prefabs import MenuButton, DataDisplay
+    game = Game()
+    for cls in (Beam, Node, Car, MenuButton, DataDisplay):
+        cls.load_game_rq(game)
+    report = cross_validate(game, args.save, *args.backends,
+                            ticks=args.ticks, spawn_every=args.spawn_every)
+    for key, value in report.items():
+        print(f"{key}: {value}")
@@ -1,6 +1,7 @@
 import math
 import pygame
 import phys
+from registry import SnapshotGroup
 
 
 class Car(pygame.sprite.Sprite):
@@ -8,10 +9,14 @@ class Car(pygame.sprite.Sprite):
     a class for simulating and displaying a car over a frame created from
     my phys.py beams and nodes
     """
-    car_image = pygame.image.load("test_car.png")
+    car_image = None
     game = None
     show_hidden = False
-    cars = pygame.sprite.Group()
+    cars = SnapshotGroup()
+    pool = []
+    MAX_POOL_SIZE = 64
+    rotation_step = 0  # degrees between cached car images, 0 for exact
+    rotated_images = {}
 
     def __init__(self, center, body_l=40, body_h=20, susp_l=30, susp_h=20,
                  def_fg=1500, mass=1000):
@@ -27,9 +32,10 @@ class Car(pygame.sprite.Sprite):
         :param mass:
         """
         super().__init__()
-        self.car_nodes = pygame.sprite.Group()
-        self.image = Car.car_image
-        self.rect = Car.car_image.get_rect()
+        self.car_nodes = SnapshotGroup()
+        self.image = Car.get_car_image()
+        self.rect = self.image.get_rect()
+        self.center_x = self.center_y = 0
         self.center = center
         self.cntrx = center[0]
         self.cntry = center[1]
@@ -57,24 +63,46 @@ class Car(pygame.sprite.Sprite):
         self.car_nodes.add(self.wheel1, self.wheel2, self.suspNode1l,
                            self.suspNode1r, self.suspNode2r, self.suspNode2l,
                            self.frameNoder, self.frameNodel)
+        # node offsets from the center, used to reset recycled cars
+        self.node_offsets = tuple((node, node.x - self.cntrx,
+                                   node.y - self.cntry)
+                                  for node in self.car_nodes)
+        # forces held over the substeps and the positions before them, kept
+        # to avoid reallocating them
+        self.held_forces = [0.0] * (2 * len(self.node_offsets))
+        self.start_positions = [0.0] * (2 * len(self.node_offsets))
 
-        phys.Beam(self.suspNode1l, self.frameNodel, "car_frame")
-        phys.Beam(self.suspNode1r, self.frameNodel, "car_frame")
-        phys.Beam(self.suspNode2l, self.frameNoder, "car_frame")
-        phys.Beam(self.suspNode2r, self.frameNoder, "car_frame")
-        phys.Beam(self.frameNodel, self.frameNoder, "car_frame")
-        phys.Beam(self.frameNoder, self.suspNode1r, "car_frame")
-        phys.Beam(self.frameNodel, self.suspNode2l, "car_frame")
-        phys.Beam(self.suspNode1l, self.suspNode1r, "car_frame")
-        phys.Beam(self.suspNode2l, self.suspNode2r, "car_frame")
-        phys.Beam(self.suspNode1r, self.suspNode2l, "car_frame")
-        phys.Beam(self.wheel1, self.suspNode1l, "car_spring")
-        phys.Beam(self.wheel1, self.suspNode1r, "car_spring")
-        phys.Beam(self.wheel2, self.suspNode2l, "car_spring")
-        phys.Beam(self.wheel2, self.suspNode2r, "car_spring")
-        phys.Beam(self.wheel2, self.wheel1, "car_spring")
+        self.car_beams = (
+            phys.Beam(self.suspNode1l, self.frameNodel, "car_frame"),
+            phys.Beam(self.suspNode1r, self.frameNodel, "car_frame"),
+            phys.Beam(self.suspNode2l, self.frameNoder, "car_frame"),
+            phys.Beam(self.suspNode2r, self.frameNoder, "car_frame"),
+            phys.Beam(self.frameNodel, self.frameNoder, "car_frame"),
+            phys.Beam(self.frameNoder, self.suspNode1r, "car_frame"),
+            phys.Beam(self.frameNodel, self.suspNode2l, "car_frame"),
+            phys.Beam(self.suspNode1l, self.suspNode1r, "car_frame"),
+            phys.Beam(self.suspNode2l, self.suspNode2r, "car_frame"),
+            phys.Beam(self.suspNode1r, self.suspNode2l, "car_frame"),
+            phys.Beam(self.wheel1, self.suspNode1l, "car_spring"),
+            phys.Beam(self.wheel1, self.suspNode1r, "car_spring"),
+            phys.Beam(self.wheel2, self.suspNode2l, "car_spring"),
+            phys.Beam(self.wheel2, self.suspNode2r, "car_spring"),
+            phys.Beam(self.wheel2, self.wheel1, "car_spring"))
         self.add(Car.cars)
 
+    @property
+    def center(self):
+        """
+        the center as a tuple, only built when something reads it
+        :return:
+        """
+        return self.center_x, self.center_y
+
+    @center.setter
+    def center(self, center):
+        self.center_x = center[0]
+        self.center_y = center[1]
+
     def update(self, mouse):
         """
         handles updates for the car object, makes the wheels check for collision
@@ -86,20 +114,67 @@ class Car(pygame.sprite.Sprite):
         for node in self.car_nodes:
             if node.for_del:
                 self.delete_car()
-                break
+                return
+        collide = Car.game.backend.collide
         for beam in phys.Beam.paved_beams:
-            if beam.collide_beam(self.wheel1):
+            if collide(beam, self.wheel1):
                 self.wheel1.Fx -= 1000
                 self.suspNode1r.Fx -= 1000
-            if beam.collide_beam(self.wheel2):
+            if collide(beam, self.wheel2):
                 self.wheel2.Fx -= 1000
                 self.suspNode2l.Fx -= 1000
-        self.center = ((self.suspNode1r.x + self.suspNode2l.x) / 2,
-                       (self.suspNode1r.y + self.suspNode2l.y) / 2)
-        self.car_nodes.update(mouse)
-        if not Car.show_hidden:
+        self.center_x = (self.suspNode1r.x + self.suspNode2l.x) / 2
+        self.center_y = (self.suspNode1r.y + self.suspNode2l.y) / 2
+        if Car.game.car_substeps > 1:
+            self.update_substeps(mouse, Car.game.car_substeps)
+        else:
+            self.car_nodes.update(mouse, Car.game.delta_t,
+                                  phys.Node.step_decay(Car.game.delta_t))
+        if not Car.show_hidden and Car.game.draw_enabled:
             self.draw_car_body()
 
+    def update_substeps(self, mouse, substeps):
+        """
+        integrates the car's own spring-mass system several times within one
+        bridge tick, the light car nodes on stiff springs need a much shorter
+        step than the heavy bridge nodes. the contact and drive forces found
+        by the wheel collisions are exchanged at the bridge rate and held
+        constant over the substeps, the springs are recomputed every substep.
+        the positions before the first substep are kept as the previous
+        positions, so the swept wheel test sees the motion of the whole tick
+        :param mouse:
+        :param substeps:
+        :return:
+        """
+        delta_t = Car.game.delta_t / substeps
+        decay = phys.Node.step_decay(delta_t)
+        nodes = self.car_nodes.snapshot()
+        held = self.held_forces
+        start = self.start_positions
+        for i, node in enumerate(nodes):
+            held[2 * i] = node.Fx
+            held[2 * i + 1] = node.Fy
+            start[2 * i] = node.x
+            start[2 * i + 1] = node.y
+        for _ in range(substeps):
+            for i, node in enumerate(nodes):
+                node.Fx = held[2 * i]
+                node.Fy = held[2 * i + 1]
+            for beam in self.car_beams:
+                if beam.breaking != 0 or not beam.alive():
+                    continue
+                beam.dx = abs(beam.node1.x - beam.node2.x)
+                beam.dy = abs(beam.node1.y - beam.node2.y)
+                if beam.dx != 0 or beam.dy != 0:
+                    beam.update_physics()
+            for node in nodes:
+                node.update_physics(delta_t, decay)
+        for i, node in enumerate(nodes):
+            node.prev_x = start[2 * i]
+            node.prev_y = start[2 * i + 1]
+            node.draw(mouse)
+            node.reset_forces()
+
     def draw_car_body(self):
         """
         rotates and blits an image over the physics frame underneath
@@ -111,15 +186,20 @@ class Car(pygame.sprite.Sprite):
             angle = math.atan((self.frameNodel.y - self.frameNoder.y) / (
                         self.frameNodel.x - self.frameNoder.x))
         if self.frameNodel.x >= self.frameNoder.x:
-            self.image = pygame.transform.rotate(Car.car_image,
-                                                 -angle / 3.14 * 180 + 180)
-            self.rect = self.image.get_rect()
-            self.rect.center = self.center
+            degrees = -angle / 3.14 * 180 + 180
+        else:
+            degrees = -angle / 3.14 * 180
+        if Car.rotation_step:
+            # coarse rotation, images are rotated once and then reused
+            degrees = round(degrees / Car.rotation_step) * Car.rotation_step
+            self.image = Car.rotated_images.get(degrees)
+            if self.image is None:
+                self.image = Car.rotated_images[degrees] = \
+                    pygame.transform.rotate(Car.car_image, degrees)
         else:
-            self.image = pygame.transform.rotate(Car.car_image,
-                                                 -angle / 3.14 * 180)
-            self.rect = self.image.get_rect()
-            self.rect.center = self.center
+            self.image = pygame.transform.rotate(Car.car_image, degrees)
+        self.rect = self.image.get_rect()
+        self.rect.center = self.center
         Car.game.screen.blit(self.image, self.rect)
 
     def delete_car(self):
@@ -128,11 +208,95 @@ class Car(pygame.sprite.Sprite):
         check whether the car fell off from the bridge and updates death toll
         :return:
         """
-        if Car.game.window.left < self.center[0] < Car.game.window.right:
-            Car.game.update_death_toll((int(self.center[0]) % 3) + 1)
-        for node in self.car_nodes:
-            node.delete_node()
+        if Car.game.window.left < self.center_x < Car.game.window.right:
+            Car.game.update_death_toll((int(self.center_x) % 3) + 1)
+        self.recycle()
+
+    def recycle(self):
+        """
+        removes the car and its beams from the simulation and keeps the whole
+        assembly in the pool so it can be spawned again without allocating
+        :return:
+        """
+        for beam in self.car_beams:
+            beam.kill()
         self.kill()
+        if len(Car.pool) < Car.MAX_POOL_SIZE and self not in Car.pool:
+            Car.pool.append(self)
+
+    def reset(self, center):
+        """
+        puts a recycled car back at rest at a new position, restores the
+        spring rest lengths and adds it back to the simulation
+        :param center:
+        :return:
+        """
+        self.center = center
+        self.cntrx = center[0]
+        self.cntry = center[1]
+        for node, offset_x, offset_y in self.node_offsets:
+            node.reset((self.cntrx + offset_x, self.cntry + offset_y))
+        for beam in self.car_beams:
+            beam.reset()
+        self.image = Car.get_car_image()
+        self.rect = self.image.get_rect()
+        self.add(Car.cars)
+
+    @classmethod
+    def simulated_nodes(cls):
+        """
+        returns the nodes of all cars, used by batched physics backends
+        :return:
+        """
+        if Car.game.car_substeps > 1:
+            return []  # the cars integrate themselves in their substeps
+        return [node for car in Car.cars for node in car.car_nodes]
+
+    @classmethod
+    def spawn(cls, center):
+        """
+        returns a car at the given position, reusing a pooled one if possible
+        :param center:
+        :return:
+        """
+        if Car.pool:
+            car = Car.pool.pop()
+            car.reset(center)
+            return car
+        return Car(center)
+
+    @classmethod
+    def prewarm(cls, count):
+        """
+        fills the pool ahead of time so spawning during a run never allocates
+        :param count:
+        :return:
+        """
+        for _ in range(min(count, Car.MAX_POOL_SIZE) - len(Car.pool)):
+            Car((0, 0)).recycle()
+
+    @classmethod
+    def recycle_all(cls):
+        """
+        returns every active car to the pool
+        :return:
+        """
+        for car in Car.cars.sprites():
+            car.recycle()
+
+    @classmethod
+    def get_car_image(cls):
+        """
+        loads the car image on first use instead of at import time
+        :return:
+        """
+        if Car.car_image is None:
+            if Car.game is not None:
+                Car.car_image = Car.game.assets.get_image("test_car.png",
+                                                          alpha=True)
+            else:
+                Car.car_image = pygame.image.load("test_car.png")
+        return Car.car_image
 
     @classmethod
     def load_game_rq(cls, game):
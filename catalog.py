@@ -0,0 +1,176 @@
+import json
+import os
+import pickle
+import struct
+import time
+
+# fixed-size header in front of the pickled structure: magic, node count,
+# beam count, money, save time and the name of the level the save belongs to
+HEADER = struct.Struct("<4sIIdd32s")
+MAGIC = b"MXS1"
+INDEX_NAME = ".catalog.json"
+
+
+class SaveInfo:
+    """
+    metadata of a single savegame, read from its header without unpickling
+    the structure
+    """
+
+    def __init__(self, name, level, nodes, beams, money, saved_at, mtime,
+                 size):
+        self.name = name
+        self.level = level
+        self.nodes = nodes
+        self.beams = beams
+        self.money = money
+        self.saved_at = saved_at
+        self.mtime = mtime
+        self.size = size
+
+    def label(self):
+        """
+        returns a one line summary for menus
+        :return:
+        """
+        return (f"{self.name}  {self.nodes}n {self.beams}b  "
+                f"{self.money:.0f} mln")
+
+    def to_dict(self):
+        """
+        returns the metadata as plain data for the index file
+        :return:
+        """
+        return dict(vars(self))
+
+
+def level_of(save_name):
+    """
+    guesses the level of a save from its name, like level2_saved -> level2
+    :param save_name:
+    :return:
+    """
+    return save_name.split("_")[0]
+
+
+def write_save_file(path, snapshot, level_name):
+    """
+    writes the header and the pickled snapshot to a file
+    :param path:
+    :param snapshot: (nodes, beams, money) as made by Game.snapshot_structure
+    :param level_name:
+    :return:
+    """
+    nodes, beams, money = snapshot
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(nodes), len(beams), money, time.time(),
+                            level_name.encode()[:32]))
+        pickle.dump(snapshot, f)
+
+
+def read_save_file(path):
+    """
+    reads the snapshot of a save, saves written before headers were added
+    are plain pickles
+    :param path:
+    :return:
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            f.seek(HEADER.size)
+        else:
+            f.seek(0)
+        return pickle.load(f)
+
+
+def read_save_info(path):
+    """
+    reads the metadata of a save, only saves without a header are unpickled
+    :param path:
+    :return: SaveInfo
+    """
+    stat = os.stat(path)
+    name = os.path.basename(path)
+    with open(path, "rb") as f:
+        data = f.read(HEADER.size)
+    if data[:len(MAGIC)] == MAGIC and len(data) == HEADER.size:
+        _, nodes, beams, money, saved_at, level = HEADER.unpack(data)
+        level = level.rstrip(b"\0").decode()
+    else:
+        nodes, beams, money = read_save_file(path)
+        nodes = len(nodes)
+        beams = len(beams)
+        saved_at = stat.st_mtime
+        level = level_of(name)
+    return SaveInfo(name, level, nodes, beams, money, saved_at,
+                    stat.st_mtime, stat.st_size)
+
+
+class SaveCatalog:
+    """
+    index of the savegames directory, headers are only read again for files
+    whose modification time or size changed and the index is kept on disk so
+    even the first listing after a restart does not open unchanged saves
+    """
+
+    def __init__(self, directory="savegames"):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.saves = {}
+        try:
+            with open(self.index_path) as f:
+                for entry in json.load(f):
+                    self.saves[entry["name"]] = SaveInfo(**entry)
+        except (OSError, ValueError, TypeError, KeyError):
+            self.saves = {}
+
+    def refresh(self):
+        """
+        brings the index up to date with the directory
+        :return: True if anything changed
+        """
+        changed = False
+        found = set()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.startswith(".") or \
+                    entry.name.endswith(".tmp"):
+                continue
+            found.add(entry.name)
+            stat = entry.stat()
+            info = self.saves.get(entry.name)
+            if info is not None and info.mtime == stat.st_mtime and \
+                    info.size == stat.st_size:
+                continue
+            try:
+                self.saves[entry.name] = read_save_info(entry.path)
+            except Exception as exception:
+                print(f"Error reading save '{entry.name}': {exception}")
+                self.saves.pop(entry.name, None)
+                continue
+            changed = True
+        for name in set(self.saves) - found:
+            del self.saves[name]
+            changed = True
+        if changed:
+            self.write_index()
+        return changed
+
+    def write_index(self):
+        """
+        stores the index next to the saves
+        :return:
+        """
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([info.to_dict() for info in self.saves.values()], f)
+        os.replace(tmp_path, self.index_path)
+
+    def entries(self, level=None):
+        """
+        returns the indexed saves sorted by level and name
+        :param level: only saves of this level if given
+        :return:
+        """
+        return sorted((info for info in self.saves.values()
+                       if level is None or info.level == level),
+                      key=lambda info: (info.level, info.name))
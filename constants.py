@@ -1,9 +1,13 @@
 import pygame
-CAR_SPAWN = pygame.event.custom_type()
+# a fixed event id instead of pygame.event.custom_type() so importing this
+# module does not touch the pygame event system
+CAR_SPAWN = pygame.USEREVENT + 1
 
 SCREEN_WIDTH = 1600
 SCREEN_HEIGHT = 800
 SET_FPS = 144
+DELTA_T = 0.1  # simulated time per bridge tick the car schedules are made for
+PHYSICS_BACKEND = "python"  # see backends.available_backends()
 
 
 WHITE = (255, 255, 255)
@@ -0,0 +1,221 @@
+import os
+import queue
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pygame
+
+
+def encode_png(path, raw, size):
+    """
+    writes one raw RGB frame as a png, runs in a pool process
+    :param path:
+    :param raw:
+    :param size:
+    :return:
+    """
+    pygame.image.save(pygame.image.frombytes(raw, size, "RGB"), path)
+
+
+class PngSequenceEncoder:
+    """
+    encodes frames into a numbered png sequence on a process pool, at most
+    queue_size frames are in flight so memory stays bounded and the
+    simulation only waits when the pool falls that far behind
+    """
+
+    def __init__(self, directory, size, workers=None, queue_size=16):
+        """
+        :param directory: output directory, created if missing
+        :param size: frame size
+        :param workers: pool processes, by default one per cpu
+        :param queue_size: frames that may wait for encoding
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.size = size
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.pool = ProcessPoolExecutor(workers)
+        self.errors = []
+        self.frames = 0
+
+    def submit(self, raw):
+        """
+        queues a raw RGB frame
+        :param raw:
+        :return:
+        """
+        self.slots.acquire()
+        path = os.path.join(self.directory, f"frame_{self.frames:06d}.png")
+        self.frames += 1
+        future = self.pool.submit(encode_png, path, raw, self.size)
+        future.add_done_callback(self.frame_done)
+
+    def frame_done(self, future):
+        """
+        pool callback, frees the queue slot of a written frame
+        :param future:
+        :return:
+        """
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+        self.slots.release()
+
+    def close(self):
+        """
+        waits for all queued frames to be written
+        :return:
+        """
+        self.pool.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+
+
+class PipeEncoder:
+    """
+    streams raw frames into the stdin of a local encoder binary such as
+    ffmpeg, a writer thread feeds the pipe from a bounded queue. an encoder
+    that exits early makes submit and close raise instead of waiting for a
+    queue nobody empties
+    """
+    POLL_INTERVAL = 0.1  # seconds between encoder checks while blocked
+
+    def __init__(self, command, size, queue_size=16):
+        """
+        :param command: argument list of the encoder, reading raw frames
+        :param size: frame size
+        :param queue_size: frames that may wait for the encoder
+        """
+        self.size = size
+        self.frames = 0
+        self.error = None  # set by the writer thread when the pipe breaks
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.run, name="frame-writer",
+                                       daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def ffmpeg(cls, output, size, fps, binary="ffmpeg", queue_size=16):
+        """
+        creates an encoder writing a video file with ffmpeg
+        :param output:
+        :param size:
+        :param fps:
+        :param binary:
+        :param queue_size:
+        :return:
+        """
+        command = [binary, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24",
+                   "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+                   "-pix_fmt", "yuv420p", output]
+        return cls(command, size, queue_size)
+
+    def run(self):
+        """
+        the writer thread loop
+        :return:
+        """
+        try:
+            while True:
+                raw = self.queue.get()
+                if raw is None:
+                    break
+                self.process.stdin.write(raw)
+            self.process.stdin.close()
+        except OSError as error:  # BrokenPipeError when the encoder exited
+            self.error = error
+
+    def check(self):
+        """
+        raises if the writer thread failed or the encoder exited before it
+        got all frames
+        :return:
+        """
+        if self.error is not None:
+            raise RuntimeError(f"writing to the encoder failed: {self.error}")
+        if self.process.poll() is not None:
+            raise RuntimeError(f"encoder exited early with "
+                               f"{self.process.returncode}")
+
+    def put(self, item):
+        """
+        puts an item into the queue, checking the encoder while it is full
+        :param item:
+        :return:
+        """
+        while True:
+            self.check()
+            try:
+                self.queue.put(item, timeout=PipeEncoder.POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def submit(self, raw):
+        """
+        queues a raw RGB frame, blocks while the queue is full
+        :param raw:
+        :return:
+        """
+        self.put(raw)
+        self.frames += 1
+
+    def close(self):
+        """
+        flushes the queue and waits for the encoder to finish, a failed
+        encoder is stopped and reported
+        :return:
+        """
+        try:
+            self.put(None)
+            self.thread.join()
+            if self.error is not None:
+                self.check()
+        except RuntimeError:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            raise
+        if self.process.wait() != 0:
+            raise RuntimeError(f"encoder exited with {self.process.returncode}")
+
+
+class FrameCapture:
+    """
+    grabs every nth drawn tick of the game screen, scaled to the export size,
+    and hands the raw pixels to an encoder
+    """
+
+    def __init__(self, encoder, every=1):
+        """
+        :param encoder: PngSequenceEncoder or PipeEncoder
+        :param every: ticks between captured frames
+        """
+        self.encoder = encoder
+        self.every = every
+        self.frame = None
+
+    def wants(self, tick):
+        """
+        checks whether a tick is captured and therefore has to be drawn
+        :param tick:
+        :return:
+        """
+        return tick % self.every == 0
+
+    def capture(self, screen):
+        """
+        scales the screen into a reused surface and submits its pixels
+        :param screen:
+        :return:
+        """
+        size = self.encoder.size
+        if screen.get_size() == tuple(size):
+            frame = screen
+        else:
+            if self.frame is None:
+                self.frame = pygame.Surface(size, 0, screen)
+            frame = pygame.transform.smoothscale(screen, size, self.frame)
+        self.encoder.submit(pygame.image.tobytes(frame, "RGB"))
@@ -1,7 +1,17 @@
-import pickle
+import math
+import os
+import time
 import pygame
 from phys import Beam, Node
 from cars import Car
+from assets import AssetManager
+from io_worker import IOWorker
+from backends import get_backend
+from catalog import SaveCatalog, read_save_file, write_save_file
+from history import CommandHistory, EditCommand
+from levels import levels
+from thumbnails import ThumbnailCache
+from timeline import Keyframe, Timeline
 from ui_prefabs import *
 from constants import *
 
@@ -27,6 +37,12 @@ class Game:
         self.car_pool = None
         self.spawn_index = 0
         self.spawned_cars = 0
+        self.tick_schedule = False  # spawn cars by simulation ticks
+        self.headless = False  # no player, nothing is written to savegames/
+        self.sim_tick = 0
+        self.next_spawn_tick = None
+        self.beam_failures = 0
+        self.final_death_toll = 0
         self.base_levelname = "savegame"
         self.curr_levelname = "savegame"
         self.gamemode = "builder"
@@ -34,7 +50,29 @@ class Game:
         self.money = 0
         self.budget = 1000
         self.death_toll = 0
-        self.background = pygame.image.load("level0.png").convert()
+        self.telemetry_dir = None
+        self.telemetry = None
+        self.timeline = None
+        self.editor_state = None  # the builder structure during a run
+        self.draw_enabled = True
+        self.delta_t = DELTA_T  # simulated time per tick of the bridge
+        self.car_substeps = 1  # car spring substeps per tick, see Car
+        self.backend = get_backend(PHYSICS_BACKEND)
+        self.io = IOWorker()
+        self.io_status = ""
+        self.loads_pending = 0
+        self.catalog = SaveCatalog()
+        self.thumbnails = ThumbnailCache(IOWorker())
+        self.history = CommandHistory(self)
+        self.modal_view = False
+        self.modal_result = None
+        self.modal_key = None
+        self.predictor = None
+        self.prediction = None
+        self.prediction_key = None
+        self.prediction_due = None  # time to submit the changed design
+        self.assets = AssetManager()
+        self.background = self.assets.get_image("level0.png")
         self.money_disp = DataDisplay((460, 10), 300, 40,
                                       "will print remaining budget", BLACK)
         self.cost_disp = DataDisplay((750, 50), 300, 40, "", RED)
@@ -42,6 +80,9 @@ class Game:
                                       f"beam type: {self.curr_beam_type}",
                                       BLACK)
         self.death_disp = DataDisplay((1150, 100), 300, 40, "", RED)
+        self.io_disp = DataDisplay((10, 720), 300, 40, "", WHITE)
+        self.modal_disp = DataDisplay((10, 680), 300, 40, "", WHITE)
+        self.prediction_disp = DataDisplay((10, 640), 300, 40, "", WHITE)
 
     def clear_all_sprites(self):
         """
@@ -49,10 +90,9 @@ class Game:
         (hopefully the contents get garbage collected)
         :return:
         """
+        Car.recycle_all()
         Beam.beams.empty()
         Node.nodes.empty()
-        Car.cars.empty()
-        Beam.paved_beams.empty()
 
     def clear_player_sprites(self):
         """
@@ -60,14 +100,64 @@ class Game:
         (hopefully the contents get garbage collected)
         :return:
         """
-        Car.cars.empty()
-        for beam in Beam.beams:
-            if beam.type != "ground":
-                beam.kill()
-        for node in Node.nodes:
-            if not node.anchored:
-                node.kill()
+        Car.recycle_all()
+        money_before = self.money
+        beams = Beam.beams.tagged("player").sprites()
+        nodes = Node.nodes.tagged("free").sprites()
+        EditCommand.remove_entities(nodes, beams)
         self.update_money(0, True)
+        self.history.record(EditCommand(nodes, beams,
+                                        self.money - money_before, False))
+
+    def build_beam(self, mouse_pos, node1, node2=None):
+        """
+        builds a beam between two nodes, or to a new node at the mouse
+        position, if the budget allows it and records the edit for undo
+        :param mouse_pos:
+        :param node1:
+        :param node2: None to create a new node at mouse_pos
+        :return:
+        """
+        money_before = self.money
+        if not self.chck_beam_cost(mouse_pos, True):
+            return False
+        nodes = []
+        if node2 is None:
+            node2 = Node(mouse_pos, self.curr_node_type)
+            nodes.append(node2)
+        beam = Beam(node2, node1, self.curr_beam_type)
+        self.history.record(EditCommand(nodes, [beam],
+                                        self.money - money_before))
+        return True
+
+    def place_node(self, mouse_pos):
+        """
+        places a lone node (used for building level ground) and records it
+        :param mouse_pos:
+        :return:
+        """
+        node = Node(mouse_pos, self.curr_node_type)
+        self.history.record(EditCommand([node], [], 0))
+        return node
+
+    def delete_node(self, node):
+        """
+        deletes a node together with its beams, refunding the beams, the
+        edit is recorded so it can be undone
+        :param node:
+        :return:
+        """
+        if not Node.nodes.has(node):  # car nodes are not part of the design
+            node.delete_node()
+            return
+        money_before = self.money
+        beams = [beam for beam in Beam.beams
+                 if beam.node1 is node or beam.node2 is node]
+        for beam in beams:
+            beam.delete_beam()
+        EditCommand.remove_entities([node], [])
+        self.history.record(EditCommand([node], beams,
+                                        self.money - money_before, False))
 
     def change_gamemode(self, gamemode):
         """
@@ -78,24 +168,254 @@ class Game:
         """
         if gamemode == "builder":
             if self.gamemode == "simulation":
-                self.load_game(self.curr_levelname)
+                self.stop_telemetry()
+                self.restore_editor_state()
             Node.is_gravity_on = False
             Node.is_frozen = True
             self.gamemode = "builder"
-            pygame.time.set_timer(CAR_SPAWN, 0)
+            self.set_spawn_timer(0)
+            self.timeline = None
         elif gamemode == "simulation":
             if self.gamemode == "builder":
-                self.save_game(self.curr_levelname)
-                self.update_death_toll(0, True)
-                self.spawn_index = 0
-                self.spawned_cars = 0
-                self.spawn_car()
+                if not self.headless:
+                    self.save_game(self.curr_levelname)
+                self.editor_state = Keyframe(self)
+                self.start_telemetry()
+                self.start_car_schedule()
+                self.timeline = Timeline(self)
+                self.timeline.record()
             Node.is_gravity_on = True
             Node.is_frozen = False
             self.gamemode = "simulation"
         elif gamemode == "creative":
             self.gamemode = "creative"
 
+    def restore_editor_state(self):
+        """
+        puts back the structure the run started from. the same node and beam
+        objects are restored, so the undo history stays valid across a run.
+        when a save was loaded during the run the editor save is loaded
+        instead, headless runs do not write one and keep the structure as is
+        :return:
+        """
+        Car.recycle_all()
+        if self.editor_state is None:
+            if not self.headless:
+                self.load_game(self.curr_levelname)
+            return
+        self.editor_state.restore(self, structure_only=True)
+        self.editor_state = None
+
+    def start_car_schedule(self):
+        """
+        resets the run counters and spawns the first car of the level's pool
+        :return:
+        """
+        self.update_death_toll(0, True)
+        self.spawn_index = 0
+        self.spawned_cars = 0
+        self.sim_tick = 0
+        self.beam_failures = 0
+        Car.prewarm(Car.MAX_POOL_SIZE // 4)
+        self.spawn_car()
+
+    def step(self, mouse, draw=True):
+        """
+        runs a single simulation tick of all beams, cars and nodes, with
+        draw=False nothing is drawn to the screen
+        :param mouse:
+        :param draw:
+        :return:
+        """
+        self.draw_enabled = draw
+        self.sim_tick += 1
+        if self.next_spawn_tick is not None and \
+                self.sim_tick >= self.next_spawn_tick:
+            self.spawn_car()
+        if self.backend.batched:
+            self.backend.accumulate_forces(Beam.physics_beams())
+        Beam.beams.update()
+        if draw:
+            Beam.draw_beams()
+        Car.cars.update(mouse)
+        if self.backend.batched:
+            self.backend.integrate(Node.nodes.sprites() +
+                                   Car.simulated_nodes(), self.delta_t)
+        Node.nodes.update(mouse, self.delta_t,
+                          Node.step_decay(self.delta_t))
+        if self.telemetry is not None:
+            self.telemetry.record()
+        if self.timeline is not None:
+            self.timeline.record()
+        self.draw_enabled = True
+
+    def seek_timeline(self, offset):
+        """
+        moves the running simulation back or forward by a number of ticks,
+        going back restores the nearest keyframe and re-simulates from it
+        :param offset: ticks, negative to go back
+        :return:
+        """
+        if self.timeline is None or self.gamemode != "simulation":
+            return
+        tick = self.timeline.seek(max(self.timeline.earliest(),
+                                      self.sim_tick + offset))
+        print(f"timeline at {tick / SET_FPS:.1f} s")
+
+    def set_backend(self, backend):
+        """
+        switches the physics backend, takes effect from the next tick
+        :param backend: a PhysicsBackend or the name of one
+        :return:
+        """
+        if isinstance(backend, str):
+            backend = get_backend(backend)
+        self.backend = backend
+
+    def start_telemetry(self):
+        """
+        starts recording per-tick telemetry of the current structure if a
+        telemetry directory was set, every run gets its own subdirectory
+        :return:
+        """
+        if self.telemetry_dir is None:
+            return
+        # numpy is only needed here
+        from telemetry import TelemetryRecorder, new_run_dir
+        self.stop_telemetry()
+        run_name = f"{self.base_levelname}_{time.strftime('%Y%m%d_%H%M%S')}"
+        path = new_run_dir(self.telemetry_dir, run_name)
+        print(f"recording telemetry to '{path}'")
+        self.telemetry = TelemetryRecorder(path)
+
+    def stop_telemetry(self):
+        """
+        closes the active telemetry recording
+        :return:
+        """
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def toggle_modal_view(self):
+        """
+        toggles the builder overlay showing the lowest vibration modes of the
+        design and whether they resonate with the level's traffic
+        :return:
+        """
+        self.modal_view = not self.modal_view
+        self.modal_result = None
+        self.modal_key = None
+        if not self.modal_view:
+            self.modal_disp.display_data("")
+
+    def update_modal_view(self):
+        """
+        recomputes the modes whenever the structure changes and draws the
+        lowest mode shape as an animated overlay, called once per frame
+        :return:
+        """
+        if not self.modal_view or self.gamemode == "simulation":
+            return
+        key = (len(Node.nodes), len(Beam.beams), self.history.undo_stack[-1]
+               if self.history.undo_stack else None, self.delta_t)
+        if key != self.modal_key:
+            from modal import compute_modes  # numpy is only needed here
+            self.modal_key = key
+            self.modal_result = compute_modes(delta_t=self.delta_t)
+            if self.modal_result is None:
+                self.modal_disp.display_data("modes: nothing to vibrate")
+                return
+            resonant = []
+            if self.car_pool is not None:
+                resonant = self.modal_result.resonant_modes(self.car_pool)
+            text = "modes [Hz]: " + " ".join(
+                f"{frequency:.2f}" for frequency in
+                self.modal_result.frequencies[:5])
+            if resonant:
+                self.modal_disp.display_data(text + " - resonant!", None, RED)
+            else:
+                self.modal_disp.display_data(text, None, WHITE)
+        if self.modal_result is None:
+            return
+        amplitude = 30 * math.sin(pygame.time.get_ticks() / 250)
+        for beam in self.modal_result.beams:
+            if beam.alive():
+                pygame.draw.line(
+                    self.screen, WHITE,
+                    self.modal_result.displaced(beam.node1, 0, amplitude),
+                    self.modal_result.displaced(beam.node2, 0, amplitude), 1)
+
+    def toggle_prediction(self):
+        """
+        toggles the builder overlay predicting the outcome of the design, the
+        worker process is started on first use
+        :return:
+        """
+        if self.predictor is None:
+            from prediction import PredictionWorker
+            self.predictor = PredictionWorker()
+        else:
+            self.predictor.close()
+            self.predictor = None
+            self.prediction_disp.display_data("")
+        self.prediction = None
+        self.prediction_key = None
+        self.prediction_due = None
+
+    def stop_prediction(self):
+        """
+        stops the prediction worker if it runs
+        :return:
+        """
+        if self.predictor is not None:
+            self.toggle_prediction()
+
+    def update_prediction(self):
+        """
+        sends the design to the prediction worker once it stopped changing
+        for a moment, shows the latest prediction and marks the beams that
+        are predicted to fail, called once per frame
+        :return:
+        """
+        if self.predictor is None or self.gamemode == "simulation" or \
+                self.base_levelname not in levels:
+            return
+        from prediction import DEBOUNCE_MS
+        now = pygame.time.get_ticks()
+        key = (self.base_levelname, len(Node.nodes), len(Beam.beams),
+               self.history.undo_stack[-1] if self.history.undo_stack
+               else None)
+        if key != self.prediction_key:
+            self.prediction_key = key
+            self.prediction_due = now + DEBOUNCE_MS
+            self.prediction = None
+            self.prediction_disp.display_data("prediction: waiting for edits")
+        if self.prediction_due is not None and now >= self.prediction_due:
+            self.prediction_due = None
+            self.predictor.submit(self.base_levelname,
+                                  self.snapshot_structure())
+            self.prediction_disp.display_data("prediction: running")
+        prediction = self.predictor.poll()
+        if prediction is not None:
+            self.prediction = prediction
+            text = (f"prediction: {prediction.deaths} deaths, "
+                    f"{len(prediction.failed_beams)} failed beams")
+            if prediction.done:
+                text += f" - {prediction.result}"
+            else:
+                text += f" at tick {prediction.tick}"
+            color = RED if prediction.deaths or prediction.failed_beams \
+                else WHITE
+            self.prediction_disp.display_data(text, None, color)
+        if self.prediction is None:
+            return
+        for beam_id in self.prediction.failed_beams:
+            beam = Beam.beams.get_by_id(beam_id)
+            if beam is not None:
+                pygame.draw.line(self.screen, RED, beam.node1.center,
+                                 beam.node2.center, 9)
+
     def toggle_level_editing(self):
         """
         dev tool for building collision beams in levels
@@ -197,6 +517,24 @@ class Game:
                 self.death_disp.display_data(
                     f"death toll: {self.death_toll} souls")
 
+    def set_spawn_timer(self, period):
+        """
+        schedules the next car spawn, with a pygame timer in real time or,
+        with tick_schedule set, in simulation ticks. ticks are scaled by the
+        step length so the cars come at the same simulated times with any
+        delta_t
+        :param period: milliseconds between spawns, 0 stops spawning
+        :return:
+        """
+        if not self.tick_schedule:
+            pygame.time.set_timer(CAR_SPAWN, period)
+        elif period == 0:
+            self.next_spawn_tick = None
+        else:
+            scale = DELTA_T / self.delta_t
+            self.next_spawn_tick = self.sim_tick + max(
+                1, round(period * SET_FPS / 1000 * scale))
+
     def spawn_car(self):
         """
         handles spawning of cars by creating a timer based on the time specified
@@ -204,54 +542,173 @@ class Game:
         :return:
         """
         if self.car_pool[0][1] == 0:
-            pygame.time.set_timer(CAR_SPAWN, self.car_pool[0][0])
-            Car((self.window.right + 100, self.window.centery))
+            self.set_spawn_timer(self.car_pool[0][0])
+            Car.spawn((self.window.right + 100, self.window.centery))
             return  # an infinite stream of cars
         elif self.spawn_index >= len(self.car_pool):
             if len(Car.cars.sprites()) == 0:
-                pygame.time.set_timer(CAR_SPAWN, 0)
+                self.set_spawn_timer(0)
+                self.final_death_toll = self.death_toll
                 if self.death_toll > 0:
                     self.state = "failure"
                 else:
                     self.state = "success"
                 self.update_death_toll(0, reset=True)
         else:
-            pygame.time.set_timer(CAR_SPAWN, self.car_pool[self.spawn_index][0])
-            Car((self.window.right + 100, self.window.centery))
+            self.set_spawn_timer(self.car_pool[self.spawn_index][0])
+            Car.spawn((self.window.right + 100, self.window.centery))
             self.spawned_cars += 1
             if self.spawned_cars > self.car_pool[self.spawn_index][1]:
                 self.spawn_index += 1
                 self.spawned_cars = 0
 
-    def save_game(self, save_name="level1"):
+    def save_game(self, save_name="level1", wait=False):
+        """
+        takes an immutable snapshot of the structure on the main thread and
+        hands it to the io worker, which writes it to disk
+        :param save_name:
+        :param wait: block until the file is written
+        :return:
+        """
         print(f"saving game '{save_name}'")
-        node_list = []
-        beam_list = []
-        for i, node in enumerate(Node.nodes):
-            node.id = i
-            node_list.append(node.save_node())
-        for beam in Beam.beams:
-            if beam.for_saving:
-                beam_list.append(beam.save_beam())
-        with open("savegames/"+save_name, "wb") as f:
-            pickle.dump((node_list, beam_list, self.money), f)
-
-    def load_game(self, save_name="savegame"):
+        if self.loads_pending:
+            self.io.wait()  # the snapshot has to include the loaded structure
+        self.io.submit(Game.write_save, "savegames/" + save_name,
+                       self.snapshot_structure(), self.base_levelname,
+                       callback=self.save_done)
+        self.show_io_status(f"saving '{save_name}'")
+        if wait:
+            self.io.wait()
+
+    def snapshot_structure(self):
+        """
+        returns the saveable state of the structure as plain data that can
+        safely be pickled on another thread
+        :return:
+        """
+        node_list = tuple(node.save_node() for node in Node.nodes)
+        beam_list = tuple(beam.save_beam()
+                          for beam in Beam.beams.tagged("saved"))
+        return node_list, beam_list, self.money
+
+    @staticmethod
+    def write_save(path, snapshot, level_name):
+        """
+        writes a snapshot with its metadata header into a temporary file and
+        then replaces the save, so a save is never left half written, runs on
+        the io worker
+        :param path:
+        :param snapshot:
+        :param level_name: level the structure belongs to
+        :return:
+        """
+        tmp_path = path + ".tmp"
+        write_save_file(tmp_path, snapshot, level_name)
+        os.replace(tmp_path, path)
+
+    def save_done(self, result, error):
+        """
+        io worker callback for finished saves
+        :param result:
+        :param error:
+        :return:
+        """
+        if error is not None:
+            print(f"Error writing save file: {error}")
+
+    def load_game(self, save_name="savegame", reset_money=False, wait=False):
+        """
+        reads and unpickles a save on the io worker, the structure is swapped
+        in on the main thread once the save is decoded
+        :param save_name:
+        :param reset_money: reset the money to the budget instead of using
+        the saved amount
+        :param wait: block until the structure is swapped in
+        :return:
+        """
         print(f"loading saved game '{save_name}'")
+        self.loads_pending += 1
+        self.io.submit(Game.read_save, "savegames/" + save_name,
+                       callback=lambda saved_level, error: self.apply_save(
+                           saved_level, error, reset_money))
+        self.show_io_status(f"loading '{save_name}'")
+        if wait:
+            self.io.wait()
+
+    @staticmethod
+    def read_save(path):
+        """
+        reads and unpickles a save file, runs on the io worker
+        :param path:
+        :return:
+        """
+        return read_save_file(path)
+
+    def apply_save(self, saved_level, error, reset_money=False):
+        """
+        replaces the current structure with a decoded save in one go
+        :param saved_level:
+        :param error:
+        :param reset_money:
+        :return:
+        """
+        self.loads_pending -= 1
         try:
-            with open("savegames/"+save_name, "rb") as f:
-                saved_level = pickle.load(f)
-                node_list = saved_level[0]
-                beam_list = saved_level[1]
-                saved_money = saved_level[2]
-            self.update_money(saved_money - self.money)
+            if error is not None:
+                raise error
+            node_list = saved_level[0]
+            beam_list = saved_level[1]
+            saved_money = saved_level[2]
+            if reset_money:
+                self.update_money(0, True)
+            else:
+                self.update_money(saved_money - self.money)
             self.clear_all_sprites()
-            node_ref_list = []
+            self.history.clear()
+            self.editor_state = None  # the structure was replaced
+            node_refs = {}
             for saved_node in node_list:
-                node_ref_list.append(Node(saved_node.center, saved_node.type))
+                node_refs[saved_node.id] = Node(saved_node.center,
+                                                saved_node.type,
+                                                node_id=saved_node.id)
             for saved_beam in beam_list:
-                Beam(node_ref_list[saved_beam.id1],
-                     node_ref_list[saved_beam.id2], saved_beam.type,
-                     saved_beam.base_length)
+                # saves written before beam ids were stored get new ones
+                Beam(node_refs[saved_beam.id1],
+                     node_refs[saved_beam.id2], saved_beam.type,
+                     saved_beam.base_length, getattr(saved_beam, "id", None))
         except Exception as exception:
             print(f"Error loading save file: {exception}")
+
+    def load_snapshot(self, snapshot):
+        """
+        replaces the current structure with a snapshot from
+        snapshot_structure right away, without going through a save file
+        :param snapshot:
+        :return:
+        """
+        self.loads_pending += 1
+        self.apply_save(snapshot, None)
+
+    def show_io_status(self, status):
+        """
+        sets the text of the disk activity indicator
+        :param status:
+        :return:
+        """
+        self.io_status = status
+        self.io_disp.display_data(status)
+
+    def poll_io(self):
+        """
+        applies finished io jobs and animates the disk activity indicator,
+        called once per frame
+        :return:
+        """
+        self.io.poll()
+        self.thumbnails.worker.poll()
+        if self.io.pending == 0:
+            if self.io_status:
+                self.show_io_status("")
+        else:
+            dots = "." * (pygame.time.get_ticks() // 250 % 4)
+            self.io_disp.display_data(self.io_status + dots)
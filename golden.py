@@ -0,0 +1,169 @@
+import json
+import os
+import numpy as np
+from backends import run_trajectory, trajectory_divergence
+
+GOLDEN_DIR = "golden"
+GOLDEN_SAVES = ("level1", "level2", "level3",
+                "level1_saved", "level2_saved", "level3_saved")
+TICKS = 3000
+SPAWN_EVERY = 300  # ticks between cars, about 2 seconds of game time
+SAMPLE_EVERY = 20  # ticks between stored node positions
+
+
+class Tolerances:
+    """
+    how far a new build may drift from a golden trace before the check fails
+    """
+
+    def __init__(self, position=1.0, failure_ticks=0, deaths=0):
+        """
+        :param position: largest allowed node distance in pixels
+        :param failure_ticks: allowed shift of a beam failure in ticks, the
+            set of failing beams always has to match
+        :param deaths: allowed difference of the death toll
+        """
+        self.position = position
+        self.failure_ticks = failure_ticks
+        self.deaths = deaths
+
+
+def golden_path(save_name, directory=GOLDEN_DIR):
+    """
+    returns the path of the golden trace of a savegame
+    :param save_name:
+    :param directory:
+    :return:
+    """
+    return os.path.join(directory, save_name + ".npz")
+
+
+def record_trace(game, save_name, ticks=TICKS, spawn_every=SPAWN_EVERY,
+                 sample_every=SAMPLE_EVERY):
+    """
+    runs a savegame with a fixed car schedule and returns its trace
+    :param game:
+    :param save_name:
+    :param ticks:
+    :param spawn_every:
+    :param sample_every:
+    :return: dict with positions, failures, deaths and the run settings
+    """
+    run = run_trajectory(game, save_name, ticks, spawn_every, sample_every)
+    return {"positions": run["positions"].astype(np.float32),
+            "failures": np.array([-1 if tick is None else tick
+                                  for tick in run["failures"]], np.int32),
+            "deaths": run["deaths"],
+            "meta": {"save": save_name, "ticks": ticks,
+                     "spawn_every": spawn_every,
+                     "sample_every": sample_every,
+                     "backend": game.backend.name}}
+
+
+def write_trace(trace, path):
+    """
+    stores a trace as a compressed numpy archive
+    :param trace:
+    :param path:
+    :return:
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez_compressed(path, positions=trace["positions"],
+                        failures=trace["failures"],
+                        deaths=np.array(trace["deaths"]),
+                        meta=np.array(json.dumps(trace["meta"])))
+
+
+def read_trace(path):
+    """
+    loads a trace written by write_trace
+    :param path:
+    :return:
+    """
+    with np.load(path) as archive:
+        return {"positions": archive["positions"],
+                "failures": archive["failures"],
+                "deaths": int(archive["deaths"]),
+                "meta": json.loads(str(archive["meta"]))}
+
+
+def compare_traces(golden, trace, tolerances):
+    """
+    checks a new trace against a golden one
+    :param golden:
+    :param trace:
+    :param tolerances: Tolerances
+    :return: list of problems, empty if the trace matches
+    """
+    problems = []
+    if golden["positions"].shape != trace["positions"].shape or \
+            golden["failures"].shape != trace["failures"].shape:
+        return [f"trace shape {trace['positions'].shape} differs from "
+                f"golden {golden['positions'].shape}"]
+    per_sample = trajectory_divergence(
+        golden["positions"].astype(float), trace["positions"].astype(float))
+    over = np.nonzero(per_sample > tolerances.position)[0]
+    if len(over):
+        problems.append(
+            f"nodes drift {per_sample.max():.3f} px (limit "
+            f"{tolerances.position}), first at tick "
+            f"{over[0] * golden['meta']['sample_every']}")
+    failed_golden = golden["failures"] >= 0
+    failed_trace = trace["failures"] >= 0
+    if (failed_golden != failed_trace).any():
+        problems.append(
+            f"failing beams differ: golden {np.nonzero(failed_golden)[0]}, "
+            f"now {np.nonzero(failed_trace)[0]}")
+    else:
+        shift = np.abs(golden["failures"] - trace["failures"]).max(initial=0)
+        if shift > tolerances.failure_ticks:
+            problems.append(f"beam failures shifted by {shift} ticks (limit "
+                            f"{tolerances.failure_ticks})")
+    if abs(golden["deaths"] - trace["deaths"]) > tolerances.deaths:
+        problems.append(f"death toll {trace['deaths']} instead of "
+                        f"{golden['deaths']}")
+    return problems
+
+
+def record_goldens(game, saves=GOLDEN_SAVES, directory=GOLDEN_DIR,
+                   ticks=TICKS):
+    """
+    records and stores the golden traces of the given saves
+    :param game:
+    :param saves:
+    :param directory:
+    :param ticks:
+    :return:
+    """
+    for save_name in saves:
+        trace = record_trace(game, save_name, ticks)
+        write_trace(trace, golden_path(save_name, directory))
+        print(f"{save_name}: recorded {len(trace['positions'])} samples, "
+              f"{int((trace['failures'] >= 0).sum())} beam failures, "
+              f"{trace['deaths']} deaths")
+
+
+def check_goldens(game, saves=GOLDEN_SAVES, directory=GOLDEN_DIR,
+                  tolerances=None):
+    """
+    runs the given saves again and compares them with their golden traces
+    :param game:
+    :param saves:
+    :param directory:
+    :param tolerances: Tolerances, the defaults if None
+    :return: dict of save name -> list of problems
+    """
+    if tolerances is None:
+        tolerances = Tolerances()
+    results = {}
+    for save_name in saves:
+        path = golden_path(save_name, directory)
+        if not os.path.isfile(path):
+            results[save_name] = [f"no golden trace at {path}"]
+            continue
+        golden = read_trace(path)
+        meta = golden["meta"]
+        trace = record_trace(game, save_name, meta["ticks"],
+                             meta["spawn_every"], meta["sample_every"])
+        results[save_name] = compare_traces(golden, trace, tolerances)
+    return results
@@ -0,0 +1,131 @@
+from phys import Node
+
+
+class EditCommand:
+    """
+    a single builder edit, stores the nodes and beams that were added or
+    removed together with the money change so the edit can be reverted and
+    applied again without touching anything else
+    """
+
+    def __init__(self, nodes, beams, money_delta, added=True):
+        """
+        :param nodes: nodes created or removed by the edit
+        :param beams: beams created or removed by the edit
+        :param money_delta: change of the money caused by the edit
+        :param added: True if the edit created the entities
+        """
+        self.nodes = tuple(nodes)
+        self.beams = tuple(beams)
+        self.money_delta = money_delta
+        self.added = added
+
+    @staticmethod
+    def add_entities(nodes, beams):
+        """
+        puts removed nodes and beams back into the simulation
+        :param nodes:
+        :param beams:
+        :return:
+        """
+        for node in nodes:
+            node.for_del = False
+            node.add(Node.nodes)
+        for beam in beams:
+            beam.reset()
+
+    @staticmethod
+    def remove_entities(nodes, beams):
+        """
+        takes nodes and beams out of the simulation without refunding them
+        :param nodes:
+        :param beams:
+        :return:
+        """
+        for beam in beams:
+            beam.kill()
+        for node in nodes:
+            node.for_del = True  # so references like Node.temp_node let go
+            node.kill()
+
+    def undo(self, game):
+        """
+        reverts the edit
+        :param game:
+        :return:
+        """
+        if self.added:
+            self.remove_entities(self.nodes, self.beams)
+        else:
+            self.add_entities(self.nodes, self.beams)
+        game.update_money(-self.money_delta)
+
+    def redo(self, game):
+        """
+        applies the edit again
+        :param game:
+        :return:
+        """
+        if self.added:
+            self.add_entities(self.nodes, self.beams)
+        else:
+            self.remove_entities(self.nodes, self.beams)
+        game.update_money(self.money_delta)
+
+
+class CommandHistory:
+    """
+    multi-level undo and redo for the builder, every edit is recorded as a
+    command that knows how to revert itself
+    """
+    MAX_LENGTH = 1000
+
+    def __init__(self, game):
+        self.game = game
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def record(self, command):
+        """
+        stores a finished edit, a new edit makes the redo history invalid
+        :param command:
+        :return:
+        """
+        self.undo_stack.append(command)
+        if len(self.undo_stack) > CommandHistory.MAX_LENGTH:
+            del self.undo_stack[0]
+        self.redo_stack.clear()
+
+    def undo(self):
+        """
+        reverts the last edit, returns False if there was nothing to undo
+        :return:
+        """
+        if not self.undo_stack:
+            return False
+        command = self.undo_stack.pop()
+        command.undo(self.game)
+        self.redo_stack.append(command)
+        return True
+
+    def redo(self):
+        """
+        applies the last reverted edit again, returns False if there was
+        nothing to redo
+        :return:
+        """
+        if not self.redo_stack:
+            return False
+        command = self.redo_stack.pop()
+        command.redo(self.game)
+        self.undo_stack.append(command)
+        return True
+
+    def clear(self):
+        """
+        forgets the whole history, used when the structure is replaced by a
+        loaded save
+        :return:
+        """
+        self.undo_stack.clear()
+        self.redo_stack.clear()
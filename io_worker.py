@@ -0,0 +1,71 @@
+import queue
+import threading
+
+
+class IOWorker:
+    """
+    runs disk jobs such as saving and loading on a background thread, jobs
+    are executed in the order they were submitted and their callbacks are
+    run on the main thread from poll() so they can safely touch sprites
+    """
+
+    def __init__(self):
+        """
+        starts the worker thread
+        """
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+        self.thread = threading.Thread(target=self.run, name="io-worker",
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        the worker thread loop, executes jobs and queues their results
+        :return:
+        """
+        while True:
+            job, args, callback = self.jobs.get()
+            try:
+                result = job(*args)
+                error = None
+            except Exception as exception:
+                result = None
+                error = exception
+            self.results.put((callback, result, error))
+            self.jobs.task_done()
+
+    def submit(self, job, *args, callback=None):
+        """
+        queues a job for the worker thread
+        :param job: function run on the worker thread
+        :param args: arguments for the job
+        :param callback: called on the main thread with (result, error)
+        :return:
+        """
+        self.pending += 1
+        self.jobs.put((job, args, callback))
+
+    def poll(self):
+        """
+        runs the callbacks of finished jobs, called once per frame from the
+        main thread
+        :return:
+        """
+        while True:
+            try:
+                callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.pending -= 1
+            if callback is not None:
+                callback(result, error)
+
+    def wait(self):
+        """
+        blocks until every submitted job is done and its callback has run
+        :return:
+        """
+        self.jobs.join()
+        self.poll()
@@ -0,0 +1,30 @@
+class Level:
+    def __init__(self, level_name, bckgr_name, car_pool, water_level, budget):
+        self.background_file = bckgr_name
+        self.level_name = level_name
+        self.car_pool = car_pool
+        self.water_level = water_level
+        self.budget = budget
+
+    def load(self, game):
+        game.change_gamemode("builder")
+        game.budget = self.budget
+        game.load_game(self.level_name, reset_money=True)
+        game.water_level = self.water_level
+        game.base_levelname = self.level_name
+        game.curr_levelname = self.level_name + "_editor"
+        game.car_pool = self.car_pool
+        game.spawned_cars = 0
+        game.background = game.assets.get_image(self.background_file)
+        game.update_money(0, True)
+
+
+level0 = Level("level0", "level0.png", [(2000, 0)], 0, 9999)
+level1 = Level("level1", "level1.png", [(3000, 3), (1500, 5), (900, 10)], 0,
+               900)
+level2 = Level("level2", "test_level_background.png",
+               [(2500, 3), (1500, 5), (1000, 6), (1500, 2)], 0, 700)
+level3 = Level("level3", "level3.png", [(4000, 3), (2000, 5), (1000, 5)], 0,
+               800)
+
+levels = {level.level_name: level for level in (level0, level1, level2, level3)}
@@ -0,0 +1,95 @@
+import time
+from backends import begin_headless_run, end_headless_run
+from constants import SET_FPS
+
+CARS = 20  # cars sent over the design in every run
+MIN_PERIOD = 10  # ticks between cars at the highest tried rate
+MAX_PERIOD = 600  # ticks between cars at the lowest tried rate
+CLEAR_TICKS = 4000  # ticks the last car gets to leave the screen
+
+
+def cars_per_minute(period):
+    """
+    converts ticks between cars into cars per minute of game time
+    :param period:
+    :return:
+    """
+    return round(60 * SET_FPS / period, 1)
+
+
+def run_load(game, save_name, period, cars=CARS):
+    """
+    sends a stream of cars over a savegame at a fixed spawn period, the run
+    stops at the first beam failure or death or when the cars are gone
+    :param game:
+    :param save_name:
+    :param period: ticks between cars
+    :param cars:
+    :return: dict with whether the design held, the death toll, the saved
+        beams that failed as (tick, beam id, beam type) in order and the
+        ticks and time the run took
+    """
+    from cars import Car
+    from phys import Beam
+    begin_headless_run(game, save_name)
+    Car.prewarm(cars)
+    beams = Beam.beams.tagged("saved").sprites()
+    failures = []
+    start = time.perf_counter()
+    tick = 0
+    for tick in range(cars * period + CLEAR_TICKS):
+        if tick % period == 0 and tick < cars * period:
+            Car.spawn((game.window.right + 100, game.window.centery))
+        game.step((0, 0), draw=False)
+        for beam in beams:
+            if beam.breaking == beam.fail_anim_len:  # started failing now
+                failures.append((tick, beam.id, beam.type))
+        if failures or game.death_toll or \
+                (tick >= cars * period and not Car.cars):
+            break
+    result = {"period": period, "held": not failures and not game.death_toll,
+              "deaths": game.death_toll, "failures": failures,
+              "ticks": tick + 1, "seconds": time.perf_counter() - start}
+    end_headless_run(game)
+    return result
+
+
+def find_capacity(game, save_name, cars=CARS, min_period=MIN_PERIOD,
+                  max_period=MAX_PERIOD, report=None):
+    """
+    bisects the spawn period for the shortest one the design holds, assuming
+    a design that holds a stream also holds any slower one
+    :param game:
+    :param save_name:
+    :param cars: cars in every run
+    :param min_period:
+    :param max_period:
+    :param report: called with the result of every run
+    :return: dict with the shortest held period and its cars per minute,
+        None if the design fails even at max_period, and the run at the
+        closest failing period with the beams that failed first
+    """
+    runs = {}
+
+    def held(period):
+        runs[period] = run_load(game, save_name, period, cars)
+        if report is not None:
+            report(runs[period])
+        return runs[period]["held"]
+
+    if not held(max_period):
+        return {"period": None, "cars_per_minute": 0,
+                "first_failure": runs[max_period]}
+    if held(min_period):
+        return {"period": min_period,
+                "cars_per_minute": cars_per_minute(min_period),
+                "first_failure": None}
+    low, high = min_period, max_period  # low fails, high holds
+    while high - low > 1:
+        middle = (low + high) // 2
+        if held(middle):
+            high = middle
+        else:
+            low = middle
+    return {"period": high, "cars_per_minute": cars_per_minute(high),
+            "first_failure": runs[low]}
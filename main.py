@@ -1,51 +1,30 @@
+import time
+STARTUP_T0 = time.perf_counter()
+import argparse
+import atexit
 import pygame
 import sys
 from phys import Beam, Node
 from cars import Car
+from assets import AssetManager
+from backends import available_backends
 from constants import *
 from game_handler import Game
+from levels import level0, level1, level2, level3, levels
+from profiling import FrameProfiler, PROFILE_FRAMES
+from quality import QualityGovernor
 from ui_prefabs import *
 
 
-class Level:
-    def __init__(self, level_name, bckgr_name, car_pool, water_level, budget):
-        self.background_file = bckgr_name
-        self.level_name = level_name
-        self.car_pool = car_pool
-        self.water_level = water_level
-        self.budget = budget
-
-    def load(self):
-        game.change_gamemode("builder")
-        game.load_game(self.level_name)
-        game.water_level = self.water_level
-        game.base_levelname = self.level_name
-        game.curr_levelname = self.level_name + "_editor"
-        game.car_pool = self.car_pool
-        game.spawned_cars = 0
-        game.background = pygame.image.load(self.background_file).convert()
-        game.budget = self.budget
-        game.update_money(0, True)
-
-
-level0 = Level("level0", "level0.png", [(2000, 0)], 0, 9999)
-level1 = Level("level1", "level1.png", [(3000, 3), (1500, 5), (900, 10)], 0,
-               900)
-level2 = Level("level2", "test_level_background.png",
-               [(2500, 3), (1500, 5), (1000, 6), (1500, 2)], 0, 700)
-level3 = Level("level3", "level3.png", [(4000, 3), (2000, 5), (1000, 5)], 0,
-               800)
-
-
 def welcome():
     """
     displays a welcome screen when the game is loaded,
     then waits for mouse input to continue
     """
-    welcome_screen = pygame.image.load("welcome.png").convert()
+    welcome_screen = game.assets.get_image("welcome.png")
     game.screen.blit(welcome_screen, game.window)
     pygame.display.flip()
-    while get_event_key() is None:
+    while not poll_events():
         fps.tick(SET_FPS)
     game.state = "normal"
 
@@ -55,16 +34,16 @@ def success():
     displays a success screen when the game is won,
     then waits for mouse input to continue
     """
-    success_screen = pygame.image.load("great_success.png").convert()
+    success_screen = game.assets.get_image("great_success.png")
     game.screen.blit(success_screen, game.window)
     pygame.display.flip()
     color = [0, 255, 100]
     d_color = [5, -2, 3]
-    font = pygame.font.Font('freesansbold.ttf', 100)
+    font = AssetManager.get_font(100)
     image = font.render("GREAT SUCCESS", True, color)
     rect = image.get_rect()
     rect.center = (800, 700)
-    while get_event_key() is None:
+    while not poll_events():
         for i, delta in enumerate(d_color):
             if 0 < color[i] + delta < 255:
                 color[i] += delta
@@ -82,16 +61,16 @@ def failure():
     displays a failure screen when the game is lost,
     then waits for mouse input to continue
     """
-    failure_screen = pygame.image.load("failure.png").convert()
+    failure_screen = game.assets.get_image("failure.png")
     game.screen.blit(failure_screen, game.window)
     pygame.display.flip()
     color = [0, 255, 100]
     d_color = [5, -2, 3]
-    font = pygame.font.Font('freesansbold.ttf', 300)
+    font = AssetManager.get_font(300)
     image = font.render("FAILURE", True, color)
     rect = image.get_rect()
     rect.center = (800, 650)
-    while get_event_key() is None:
+    while not poll_events():
         for i, delta in enumerate(d_color):
             if 0 < color[i] + delta < 255:
                 color[i] += delta
@@ -115,15 +94,120 @@ was_up = {pygame.K_g: True,
           pygame.K_x: True,
           pygame.K_b: True,
           pygame.K_n: True,
-          pygame.K_z: True}
+          pygame.K_z: True,
+          pygame.K_y: True,
+          pygame.K_v: True,
+          pygame.K_p: True,
+          pygame.K_LEFTBRACKET: True,
+          pygame.K_RIGHTBRACKET: True,
+          pygame.K_F9: True}
+
+
+class StartupTimer:
+    """
+    collects timestamps of the startup stages and prints them as a short
+    report, used by the --startup-timing mode
+    """
+
+    def __init__(self, enabled, t0=STARTUP_T0):
+        self.enabled = enabled
+        self.last = self.t0 = t0
+        self.stages = []
+
+    def mark(self, stage):
+        """
+        records the time spent since the previous mark
+        :param stage:
+        :return:
+        """
+        if self.enabled:
+            now = time.perf_counter()
+            self.stages.append((stage, now - self.last))
+            self.last = now
+
+    def report(self):
+        """
+        prints the collected stage timings and the total cold start time
+        :return:
+        """
+        if self.enabled:
+            print("startup timing:")
+            for stage, duration in self.stages:
+                print(f"  {stage:<16}{duration * 1000:8.1f} ms")
+            print(f"  {'total':<16}{(self.last - self.t0) * 1000:8.1f} ms")
+            self.enabled = False
+
+
+def browse_saves(menu):
+    """
+    opens the save browser with the catalog of all saves, or closes it
+    :param menu:
+    :return:
+    """
+    if menu.open:
+        menu.hide()
+        return
+    game.catalog.refresh()
+    menu.show([(info.name, f"{info.level}: {info.label()}")
+               for info in game.catalog.entries()])
+
+
+def load_save(save_name):
+    """
+    switches to the level of a save from the catalog and loads the save
+    :param save_name:
+    :return:
+    """
+    info = game.catalog.saves.get(save_name)
+    if info is not None and info.level in levels:
+        levels[info.level].load(game)
+    game.load_game(save_name)
 
 
-def get_event_key():
+def thumbnail_of(save_name):
     """
-    scans the event queue for recognized events, also handles continuous press
-    protection
+    returns the thumbnail of a save from the catalog, None while it is not
+    rendered yet
+    :param save_name:
     :return:
     """
+    info = game.catalog.saves.get(save_name)
+    if info is None:
+        return None
+    level = levels.get(info.level, level0)
+    return game.thumbnails.get(save_name, level.background_file,
+                               (info.mtime, info.size))
+
+
+def draw_preview(menu, level_buttons, position=(830, 50)):
+    """
+    draws the thumbnail of the save or level under the mouse, the
+    thumbnails of the visible save browser page are requested ahead
+    :param menu: the save browser
+    :param level_buttons: dict of level button -> level
+    :param position:
+    :return:
+    """
+    for save_name in menu.page_keys() if menu.open else ():
+        thumbnail_of(save_name)
+    save_name = menu.hovered()
+    if save_name is None and MenuButton.last_butt in level_buttons:
+        save_name = level_buttons[MenuButton.last_butt].level_name
+    if save_name is not None:
+        thumbnail = thumbnail_of(save_name)
+        if thumbnail is not None:
+            game.screen.blit(thumbnail, position)
+
+
+def poll_events():
+    """
+    drains the whole event queue and turns the recognized events into
+    commands in the order they happened, also handles continuous press
+    protection. nothing is dropped, a slow frame only delays its commands
+    to the end of that frame
+    :return: list of (key, mouse position, modifier keys) tuples
+    """
+    commands = []
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             sys.exit()
@@ -132,24 +216,179 @@ def get_event_key():
                 sys.exit()
             if event.key in was_up.keys() and was_up[event.key]:
                 was_up[event.key] = False
-                return event.key
+                commands.append((event.key, pygame.mouse.get_pos(),
+                                 event.mod))
         if event.type == pygame.KEYUP:
             if event.key in was_up.keys():
                 was_up[event.key] = True
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button in mouse_keys.keys():
                 button = mouse_keys[event.button]
-                if pygame.key.get_mods() & pygame.KMOD_LCTRL:
-                    return button + "_LCTRL"
-                else:
-                    return button
+                mods = pygame.key.get_mods()
+                if mods & pygame.KMOD_LCTRL:
+                    button += "_LCTRL"
+                commands.append((button, event.pos, mods))
         if event.type == CAR_SPAWN:
-            return "car_spawn"
-    return None
+            commands.append(("car_spawn", pygame.mouse.get_pos(), 0))
+    return commands
+
+
+def button_at(position):
+    """
+    returns the shown button at a position or None, the buttons drawn later
+    in a frame lie on top
+    :param position:
+    :return:
+    """
+    return MenuButton.button_at(tray1.shown_buttons() +
+                                saves_menu.shown_buttons() +
+                                MenuButton.menu_buttons.sprites(), position)
+
+
+def end_frame():
+    """
+    finishes a frame and waits for the next one. while a profile is captured
+    the governor keeps its quality level, the frame times include the
+    profiler's overhead, and the wait of the fps limiter is left out of the
+    capture
+    :return:
+    """
+    governor.update(fps.get_rawtime(), hold=profiler.capturing())
+    profiler.frame_done()
+    profiler.pause()
+    fps.tick(SET_FPS)
+    profiler.resume()
+
+
+def handle_command(key, position, mods):
+    """
+    carries out one command from poll_events, clicks act on the buttons and
+    nodes at the position of their own event
+    :param key:
+    :param position: mouse position when the event happened
+    :param mods: modifier keys held during the event
+    :return:
+    """
+    global mouse_offset
+    mouse = [position[0] + mouse_offset, position[1]]
+    if key == "car_spawn":
+        game.spawn_car()
+    elif key == pygame.K_g:
+        Node.switch_gravity()
+    elif key == pygame.K_l:
+        game.load_game()
+    elif key == pygame.K_m:
+        game.save_game(game.base_levelname)
+    elif key == pygame.K_n:
+        game.save_game("welcome")
+    elif key == pygame.K_c:
+        Car.spawn(mouse)
+    elif key == pygame.K_z:
+        if mods & pygame.KMOD_LCTRL and game.gamemode != "simulation":
+            game.history.undo()
+    elif key == pygame.K_y:
+        if mods & pygame.KMOD_LCTRL and game.gamemode != "simulation":
+            game.history.redo()
+    elif key == pygame.K_x:  # used for placing ground outside game window
+        if mouse_offset == 0:
+            if mouse[0] < game.window.centerx:
+                mouse_offset = -400
+            else:
+                mouse_offset = 400
+        else:
+            mouse_offset = 0
+    elif key == pygame.K_b:
+        game.toggle_level_editing()
+    elif key == pygame.K_v:
+        game.toggle_modal_view()
+    elif key == pygame.K_p:
+        game.toggle_prediction()
+    elif key == pygame.K_LEFTBRACKET:
+        game.seek_timeline(-5 * SET_FPS)
+    elif key == pygame.K_RIGHTBRACKET:
+        game.seek_timeline(5 * SET_FPS)
+    elif key == pygame.K_F9:
+        profiler.start()
+    elif key == "l_mouse":
+        game.change_built_type()
+    elif key == "r_mouse_LCTRL":
+        node = Node.node_at(mouse)
+        if mods & pygame.KMOD_LCTRL:
+            if node is not None:
+                game.delete_node(node)
+            else:
+                Node.temp_node = None
+    elif key == "r_mouse":
+        button = button_at(mouse)
+        node = Node.node_at(mouse)
+        if saves_menu.has(button):
+            picked = saves_menu.click(button)
+            if picked is not None:
+                saves_menu.hide()
+                load_save(picked)
+        elif button is not None:
+            if button == tray1.cover_button:
+                tray1.toggle_tray()
+            elif button == butt_l1:
+                level1.load(game)
+            elif button == butt_l2:
+                level2.load(game)
+            elif button == butt_l3:
+                level3.load(game)
+            elif button == butt_lod:
+                game.load_game(game.base_levelname + "_saved")
+            elif button == butt_brw:
+                browse_saves(saves_menu)
+            elif button == butt_sav:
+                game.save_game(game.base_levelname + "_saved")
+            elif button == butt_run:
+                game.change_gamemode("simulation")
+            elif button == butt_stp:
+                game.change_gamemode("builder")
+            elif button == butt_del:
+                game.clear_player_sprites()
+        elif node is not None:
+            if Node.temp_node is None:
+                Node.temp_node = node
+            elif node == Node.temp_node:
+                Node.temp_node = None
+            else:
+                if game.build_beam(mouse, Node.temp_node, node):
+                    Node.temp_node = None
+        elif Node.temp_node is not None:
+            if game.build_beam(mouse, Node.temp_node):
+                Node.temp_node = None
+        elif game.is_level_editing_on:
+            Node.temp_node = game.place_node(mouse)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mostex bridge builder")
+    parser.add_argument("--startup-timing", action="store_true",
+                        help="skip the welcome screen and print how long "
+                             "each startup stage took")
+    parser.add_argument("--telemetry", metavar="DIR", default=None,
+                        help="record per-tick beam and node telemetry of "
+                             "every simulation run into DIR")
+    parser.add_argument("--physics-backend", default=PHYSICS_BACKEND,
+                        choices=available_backends(),
+                        help="implementation used for beam forces and node "
+                             "integration")
+    parser.add_argument("--profile", metavar="FRAMES", type=int, nargs="?",
+                        const=PROFILE_FRAMES, default=None,
+                        help="profile the first FRAMES frames into profiles/, "
+                             "F9 starts a capture at any time")
+    args = parser.parse_args()
+    startup = StartupTimer(args.startup_timing)
+    startup.mark("imports")
     game = Game()
+    # cars spawn by simulation ticks, a slow frame can not bunch or drop them
+    game.tick_schedule = True
+    game.telemetry_dir = args.telemetry
+    game.set_backend(args.physics_backend)
+    atexit.register(game.stop_telemetry)
+    atexit.register(game.stop_prediction)
+    atexit.register(game.io.wait)
     fps = pygame.time.Clock()
     Beam.load_game_rq(game)
     Node.load_game_rq(game)
@@ -162,16 +401,31 @@ if __name__ == "__main__":
     butt_l3 = MenuButton((0, 0), "level 3", 180, 40, YELLOW)
     butt_sav = MenuButton((0, 0), "save", 180, 40, ORANGE)
     butt_lod = MenuButton((0, 0), "load", 180, 40, ORANGE)
+    butt_brw = MenuButton((0, 0), "browse", 180, 40, ORANGE)
     tray1 = MenuTray((0, 0), "Select Level", 250, 40, YELLOW, "-y", 10, butt_l1,
-                     butt_l2, butt_l3, butt_sav, butt_lod)
+                     butt_l2, butt_l3, butt_sav, butt_lod, butt_brw)
+    saves_menu = ListMenu((260, 50), 560, 40, 12, ORANGE)
+    level_buttons = {butt_l1: level1, butt_l2: level2, butt_l3: level3}
     butt_run = MenuButton((1300, 0), "Simulation Mode", 300, 40, ORANGE)
     butt_stp = MenuButton((1000, 0), "Editing Mode", 300, 40, YELLOW)
     butt_del = MenuButton((250, 0), "Delete All", 200, 40, RED)
     MenuButton.menu_buttons.add(butt_del, butt_run, butt_stp)
+    governor = QualityGovernor(game)
+    profiler = FrameProfiler(game)
 
-    welcome()
-    level0.load()
+    startup.mark("game init")
+    if not args.startup_timing:
+        welcome()
+    game.assets.preload(*[level.background_file for level in
+                          (level0, level1, level2, level3)],
+                        "great_success.png", "failure.png")
+    game.catalog.refresh()
+    startup.mark("asset preload")
+    level0.load(game)
     game.change_gamemode("simulation")
+    startup.mark("level load")
+    if args.profile:
+        profiler.start(args.profile)
     running = True
     mouse_offset = 0
     while running:
@@ -179,82 +433,17 @@ if __name__ == "__main__":
             failure()
         elif game.state == "success":
             success()
+        game.poll_io()
         mouse = list(pygame.mouse.get_pos())
         mouse[0] += mouse_offset
-        key = get_event_key()
-        if key == "car_spawn":
-            game.spawn_car()
-        elif key == pygame.K_g:
-            Node.switch_gravity()
-        elif key == pygame.K_l:
-            game.load_game()
-        elif key == pygame.K_m:
-            game.save_game(game.base_levelname)
-        elif key == pygame.K_n:
-            game.save_game("welcome")
-        elif key == pygame.K_c:
-            Car(mouse)
-        elif key == pygame.K_z:
-            if pygame.key.get_mods() & pygame.KMOD_LCTRL:
-                if Beam.last_built is not None:
-                    Beam.last_built.delete_beam()
-        elif key == pygame.K_x:  # used for placing ground outside game window
-            if mouse_offset == 0:
-                if mouse[0] < game.window.centerx:
-                    mouse_offset = -400
-                else:
-                    mouse_offset = 400
-            else:
-                mouse_offset = 0
-        elif key == pygame.K_b:
-            game.toggle_level_editing()
-        elif key == "l_mouse":
-            game.change_built_type()
-        elif key == "r_mouse_LCTRL":
-            if pygame.key.get_mods() & pygame.KMOD_LCTRL:
-                if Node.last_node is not None:
-                    Node.last_node.delete_node()
-                else:
-                    Node.temp_node = None
-        elif key == "r_mouse":
-            if MenuButton.last_butt is not None:
-                if MenuButton.last_butt == tray1.cover_button:
-                    tray1.toggle_tray()
-                elif MenuButton.last_butt == butt_l1:
-                    level1.load()
-                elif MenuButton.last_butt == butt_l2:
-                    level2.load()
-                elif MenuButton.last_butt == butt_l3:
-                    level3.load()
-                elif MenuButton.last_butt == butt_lod:
-                    game.load_game(game.base_levelname + "_saved")
-                elif MenuButton.last_butt == butt_sav:
-                    game.save_game(game.base_levelname + "_saved")
-                elif MenuButton.last_butt == butt_run:
-                    game.change_gamemode("simulation")
-                elif MenuButton.last_butt == butt_stp:
-                    game.change_gamemode("builder")
-                elif MenuButton.last_butt == butt_del:
-                    game.clear_player_sprites()
-            elif Node.last_node is not None:
-                if Node.temp_node is None:
-                    Node.temp_node = Node.last_node
-                elif Node.last_node == Node.temp_node:
-                    Node.temp_node = None
-                else:
-                    if game.chck_beam_cost(mouse, True):
-                        Beam(Node.last_node, Node.temp_node,
-                             game.curr_beam_type)
-                        Node.temp_node = None
-            elif Node.temp_node is not None:
-                if game.chck_beam_cost(mouse, True):
-                    Beam(Node(mouse, game.curr_node_type), Node.temp_node,
-                         game.curr_beam_type)
-                    Node.temp_node = None
-            elif game.is_level_editing_on:
-                Node.temp_node = Node(mouse, game.curr_node_type)
-        game.screen.fill(BLACK)
-        game.screen.blit(game.background, game.window)
+        for key, position, mods in poll_events():
+            handle_command(key, position, mods)
+        if not governor.draw_frame():  # only the simulation runs
+            if game.gamemode == "simulation":
+                game.step(mouse, draw=False)
+            end_frame()
+            continue
+        governor.draw_background()
         if Node.temp_node is not None:
             game.chck_beam_cost(mouse, False)
             if Node.temp_node.for_del:
@@ -281,13 +470,15 @@ if __name__ == "__main__":
         pygame.draw.circle(game.screen, WHITE, mouse, 1)
         Node.last_node = None
         MenuButton.last_butt = None
-        Beam.beams.update()
-        Car.cars.update(mouse)
-        Node.nodes.update(mouse)
+        game.step(mouse)
+        game.update_modal_view()
+        game.update_prediction()
         tray1.update(mouse)
+        saves_menu.update(mouse)
         MenuButton.menu_buttons.update(mouse)
         DataDisplay.data_displays.update()
+        draw_preview(saves_menu, level_buttons)
         pygame.display.flip()
-        if fps.get_fps() < SET_FPS * 0.90:
-            print(fps.get_fps())
-        fps.tick(SET_FPS)
+        startup.mark("first frame")
+        startup.report()
+        end_frame()
@@ -0,0 +1,148 @@
+import math
+import numpy as np
+from phys import Beam, Node
+from constants import *
+
+try:
+    from scipy import sparse
+    from scipy.sparse.linalg import eigsh
+except ImportError:  # scipy is optional, small structures work with numpy
+    sparse = None
+    eigsh = None
+
+
+class ModalResult:
+    """
+    the lowest vibration modes of a structure, frequencies are in real
+    seconds of the running game and every shape holds an (x, y) displacement
+    for each free node
+    """
+
+    def __init__(self, frequencies, shapes, nodes, beams):
+        self.frequencies = frequencies
+        self.shapes = shapes
+        self.nodes = nodes
+        self.beams = beams
+        self.index = {node: i for i, node in enumerate(nodes)}
+
+    def resonant_modes(self, car_pool, tolerance=0.1):
+        """
+        returns the indices of modes whose frequency is within tolerance of
+        a car arrival frequency of a level
+        :param car_pool: list of (spawn period in ms, car count) tuples
+        :param tolerance: allowed relative distance
+        :return:
+        """
+        arrival = [1000 / period for period, _ in car_pool if period > 0]
+        return [i for i, frequency in enumerate(self.frequencies)
+                if any(abs(frequency - base) <= base * tolerance
+                       for base in arrival)]
+
+    def displaced(self, node, mode, amplitude):
+        """
+        returns the position of a node displaced along a mode shape
+        :param node:
+        :param mode:
+        :param amplitude:
+        :return:
+        """
+        i = self.index.get(node)
+        if i is None:
+            return node.x, node.y
+        shape = self.shapes[mode]
+        return (node.x + shape[2 * i] * amplitude,
+                node.y + shape[2 * i + 1] * amplitude)
+
+
+def build_matrices(nodes, beams):
+    """
+    assembles the mass and stiffness matrices of a structure, every free node
+    has an x and y degree of freedom, anchored nodes are fixed. beams are
+    linearized as axial springs around their current geometry using their
+    tension stiffness
+    :param nodes: free nodes, their order defines the degrees of freedom
+    :param beams:
+    :return: (mass diagonal, stiffness matrix as sparse csr or dense array)
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+    size = 2 * len(nodes)
+    mass = np.repeat(np.array([node.mass for node in nodes], float), 2)
+    rows = []
+    cols = []
+    vals = []
+    for beam in beams:
+        length = math.hypot(beam.node2.x - beam.node1.x,
+                            beam.node2.y - beam.node1.y)
+        if length == 0:
+            continue
+        c = (beam.node2.x - beam.node1.x) / length
+        s = (beam.node2.y - beam.node1.y) / length
+        block = (c * c, c * s, c * s, s * s)
+        k = beam.k_tens
+        ends = (index.get(beam.node1), index.get(beam.node2))
+        for a, i in enumerate(ends):
+            if i is None:
+                continue
+            for b, j in enumerate(ends):
+                if j is None:
+                    continue
+                sign = 1 if a == b else -1
+                for n, (di, dj) in enumerate(((0, 0), (0, 1), (1, 0),
+                                              (1, 1))):
+                    rows.append(2 * i + di)
+                    cols.append(2 * j + dj)
+                    vals.append(sign * k * block[n])
+    if sparse is not None:
+        stiffness = sparse.coo_matrix((vals, (rows, cols)),
+                                      shape=(size, size)).tocsr()
+    else:
+        stiffness = np.zeros((size, size))
+        np.add.at(stiffness, (rows, cols), vals)
+    return mass, stiffness
+
+
+def compute_modes(n_modes=6, nodes=None, beams=None, delta_t=DELTA_T):
+    """
+    computes the lowest vibration modes of the structure (by default the
+    player's design currently in the scene) with a sparse eigensolver, or a
+    dense one when scipy is not installed
+    :param n_modes:
+    :param nodes:
+    :param beams:
+    :param delta_t: simulated time per tick, converts the frequencies to
+        real seconds of the running game
+    :return: ModalResult, or None if there is nothing that can vibrate
+    """
+    if nodes is None:
+        nodes = Node.nodes.tagged("free").sprites()
+    if beams is None:
+        beams = Beam.beams.tagged("saved").sprites()
+    size = 2 * len(nodes)
+    if size == 0:
+        return None
+    mass, stiffness = build_matrices(nodes, beams)
+    # K x = w^2 M x with a diagonal M becomes a standard symmetric problem
+    scale = 1 / np.sqrt(mass)
+    n_modes = min(n_modes, size)
+    if eigsh is not None and n_modes < size - 1:
+        scaling = sparse.diags(scale)
+        system = scaling @ stiffness @ scaling
+        # shift-invert just below zero finds the lowest modes and still works
+        # for structures with mechanisms (zero stiffness modes)
+        shift = -1e-6 * (abs(system.diagonal()).max() + 1)
+        eigenvalues, vectors = eigsh(system, n_modes, sigma=shift,
+                                     which="LM")
+    else:
+        if sparse is not None:
+            stiffness = stiffness.toarray()
+        system = scale[:, None] * stiffness * scale[None, :]
+        eigenvalues, vectors = np.linalg.eigh(system)
+        eigenvalues = eigenvalues[:n_modes]
+        vectors = vectors[:, :n_modes]
+    order = np.argsort(eigenvalues)
+    eigenvalues = np.clip(eigenvalues[order], 0, None)
+    shapes = (vectors[:, order] * scale[:, None]).T
+    shapes /= np.abs(shapes).max(axis=1, keepdims=True) + 1e-12
+    # ticks per second * simulated time per tick
+    frequencies = np.sqrt(eigenvalues) / (2 * math.pi) * SET_FPS * delta_t
+    return ModalResult(frequencies, shapes, nodes, beams)
@@ -0,0 +1,364 @@
+"""
+command line entry point for running the game without a window, for example
+
+    python -m mostex simulate --level level2 --save savegames/level2_saved --json
+
+runs the whole car schedule of a level on a stored design and exits with 0
+if the design passed, 1 if it failed and 2 if it could not be run
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_TICKS = 200000  # about 23 minutes of game time, level0 never ends
+
+
+def setup_game(backend=None):
+    """
+    creates a game with a dummy display for headless runs
+    :param backend: physics backend name, None keeps the default
+    :return:
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.chdir(GAME_DIR)
+    from phys import Beam, Node
+    from cars import Car
+    from game_handler import Game
+    from ui_prefabs import MenuButton, DataDisplay
+    game = Game()
+    for cls in (Beam, Node, Car, MenuButton, DataDisplay):
+        cls.load_game_rq(game)
+    if backend is not None:
+        game.set_backend(backend)
+    game.tick_schedule = True
+    game.headless = True
+    return game
+
+
+def simulate(game, level, save_name=None, speed="max", max_ticks=MAX_TICKS,
+             capture=None):
+    """
+    loads a level and optionally a design for it, runs the level's car pool
+    with a tick based schedule until it ends or max_ticks pass
+    :param game: a game created by setup_game
+    :param level: a levels.Level
+    :param save_name: name of a save in savegames/, None keeps the level as is
+    :param speed: "max" runs as fast as possible, "real" at SET_FPS
+    :param max_ticks:
+    :param capture: export.FrameCapture, the ticks it wants are drawn
+    :return: dict with the result of the run
+    """
+    import pygame
+    from constants import SET_FPS
+    level.load(game)
+    if save_name is not None:
+        game.load_game(save_name, wait=True)
+    game.io.wait()
+    cost = game.budget - game.money
+    clock = pygame.time.Clock()
+    start = time.perf_counter()
+    game.change_gamemode("simulation")
+    while game.state == "normal" and game.sim_tick < max_ticks:
+        draw = capture is not None and capture.wants(game.sim_tick)
+        if draw:
+            game.screen.blit(game.background, game.window)
+        game.step((0, 0), draw=draw)
+        if draw:
+            capture.capture(game.screen)
+        if speed == "real":
+            clock.tick(SET_FPS)
+    wall_time = time.perf_counter() - start
+    if game.state == "normal":
+        outcome = "timeout"
+        deaths = game.death_toll
+    else:
+        outcome = game.state
+        deaths = game.final_death_toll
+    game.change_gamemode("builder")
+    game.io.wait()
+    game.state = "normal"
+    return {"level": level.level_name,
+            "save": save_name,
+            "result": outcome,
+            "passed": outcome == "success",
+            "deaths": deaths,
+            "beam_failures": game.beam_failures,
+            "cost": round(cost, 2),
+            "budget": game.budget,
+            "ticks": game.sim_tick,
+            "wall_time": round(wall_time, 3)}
+
+
+def save_name_from_path(path):
+    """
+    turns a path to a savegame into the name used by Game.load_game, saves
+    have to be inside the savegames directory
+    :param path:
+    :return:
+    """
+    path = os.path.abspath(path)
+    if not os.path.isfile(path):
+        path = os.path.join(GAME_DIR, "savegames", os.path.basename(path))
+    if os.path.dirname(path) != os.path.join(GAME_DIR, "savegames") or \
+            not os.path.isfile(path):
+        raise ValueError(f"no savegame '{path}' in savegames/")
+    return os.path.basename(path)
+
+
+def golden(args):
+    """
+    runs the golden subcommand
+    :param args: parsed command line
+    :return: exit status
+    """
+    import golden as traces
+    saves = args.saves or traces.GOLDEN_SAVES
+    with contextlib.redirect_stdout(sys.stderr):
+        game = setup_game(args.physics_backend)
+    if args.action == "record":
+        traces.record_goldens(game, saves, ticks=args.ticks or traces.TICKS)
+        return 0
+    tolerances = traces.Tolerances(args.position_tol, args.failure_tick_tol,
+                                   args.death_tol)
+    with contextlib.redirect_stdout(sys.stderr):
+        results = traces.check_goldens(game, saves, tolerances=tolerances)
+    for save_name, problems in results.items():
+        print(f"{save_name}: {'ok' if not problems else 'CHANGED'}")
+        for problem in problems:
+            print(f"  {problem}")
+    return 1 if any(results.values()) else 0
+
+
+def allocs(args):
+    """
+    runs the allocs subcommand
+    :param args: parsed command line
+    :return: exit status
+    """
+    from allocations import measure_allocations, check_allocations
+    with contextlib.redirect_stdout(sys.stderr):
+        game = setup_game(args.physics_backend)
+    failed = False
+    for draw in (False, True):  # headless ticks and interactive frames
+        with contextlib.redirect_stdout(sys.stderr):
+            result = measure_allocations(game, args.save, args.ticks,
+                                         draw=draw)
+        for key, value in result.items():
+            print(f"{key}: {value}")
+        problems = check_allocations(result, args.tick_budget,
+                                     args.retained_budget, args.gc_budget)
+        for problem in problems:
+            print(problem)
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+def ramp(args):
+    """
+    runs the ramp subcommand
+    :param args: parsed command line
+    :return: exit status
+    """
+    from loadramp import find_capacity, cars_per_minute
+    try:
+        save_name = save_name_from_path(args.save)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+
+    def report(run):
+        print(f"every {run['period']} ticks "
+              f"({cars_per_minute(run['period'])} cars/min): "
+              f"{'held' if run['held'] else 'failed'} after {run['ticks']} "
+              f"ticks in {run['seconds']:.1f} s", file=sys.stderr)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        game = setup_game(args.physics_backend)
+        capacity = find_capacity(game, save_name, args.cars, args.min_period,
+                                 args.max_period, report)
+    failed = capacity["first_failure"]
+    result = {"save": save_name, "period": capacity["period"],
+              "cars_per_minute": capacity["cars_per_minute"],
+              "failing_period": None if failed is None else failed["period"],
+              "deaths": None if failed is None else failed["deaths"],
+              "first_failures": [] if failed is None else [
+                  {"tick": tick, "beam": beam_id, "type": beam_type}
+                  for tick, beam_id, beam_type in failed["failures"]]}
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key}: {value}")
+    return 0 if capacity["period"] is not None else 1
+
+
+def export_video(args):
+    """
+    runs the export subcommand
+    :param args: parsed command line
+    :return: exit status
+    """
+    from export import FrameCapture, PipeEncoder, PngSequenceEncoder
+    from constants import SET_FPS
+    from levels import levels
+    try:
+        save_name = None if args.save is None else \
+            save_name_from_path(args.save)
+        size = tuple(int(value) for value in args.size.split("x"))
+        if len(size) != 2:
+            raise ValueError(f"size '{args.size}' is not WxH")
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    out = os.path.abspath(args.out)  # setup_game changes the directory
+    try:
+        if args.encoder is not None:
+            encoder = PipeEncoder.ffmpeg(out, size, SET_FPS / args.every,
+                                         args.encoder, args.queue)
+        else:
+            encoder = PngSequenceEncoder(out, size, args.workers, args.queue)
+        with contextlib.redirect_stdout(sys.stderr):
+            game = setup_game()
+            result = simulate(game, levels[args.level], save_name,
+                              max_ticks=args.max_ticks,
+                              capture=FrameCapture(encoder, args.every))
+        start = time.perf_counter()
+        encoder.close()
+    except (OSError, RuntimeError) as error:
+        print(f"export failed: {error}", file=sys.stderr)
+        return 2
+    result["frames"] = encoder.frames
+    result["encode_wait"] = round(time.perf_counter() - start, 3)
+    result["output"] = out
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+def main(argv=None):
+    """
+    parses the command line and runs the requested command
+    :param argv:
+    :return: exit status
+    """
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    from levels import levels
+    from backends import available_backends
+    import allocations
+    import loadramp
+    parser = argparse.ArgumentParser(prog="mostex",
+                                     description="Mostex bridge builder")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sim = commands.add_parser("simulate", help="run a level headless and "
+                                               "report whether it passed")
+    sim.add_argument("--level", required=True, choices=sorted(levels))
+    sim.add_argument("--save", default=None,
+                     help="savegame with the design, by default the level's "
+                          "own structure")
+    sim.add_argument("--speed", choices=("max", "real"), default="max")
+    sim.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    sim.add_argument("--physics-backend", default=None,
+                     choices=available_backends())
+    sim.add_argument("--delta-t", type=float, default=None,
+                     help="simulated time per bridge tick (default 0.1)")
+    sim.add_argument("--car-substeps", type=int, default=1,
+                     help="car spring substeps per bridge tick")
+    sim.add_argument("--json", action="store_true",
+                     help="print the result as a json object")
+    exp = commands.add_parser("export", help="render a headless run into "
+                                             "a png sequence or a video")
+    exp.add_argument("--level", required=True, choices=sorted(levels))
+    exp.add_argument("--save", default=None)
+    exp.add_argument("--out", required=True,
+                     help="directory for png frames, or the video file "
+                          "when --encoder is given")
+    exp.add_argument("--every", type=int, default=2,
+                     help="ticks between frames")
+    exp.add_argument("--size", default="800x400", help="frame size WxH")
+    exp.add_argument("--encoder", default=None,
+                     help="ffmpeg compatible binary to pipe frames into")
+    exp.add_argument("--workers", type=int, default=None,
+                     help="png encoding processes, one per cpu by default")
+    exp.add_argument("--queue", type=int, default=16,
+                     help="frames that may wait for the encoder")
+    exp.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    rmp = commands.add_parser("ramp", help="find the highest car rate a "
+                                           "design holds")
+    rmp.add_argument("--save", required=True)
+    rmp.add_argument("--cars", type=int, default=loadramp.CARS,
+                     help="cars sent in every run")
+    rmp.add_argument("--min-period", type=int, default=loadramp.MIN_PERIOD,
+                     help="shortest tried ticks between cars")
+    rmp.add_argument("--max-period", type=int, default=loadramp.MAX_PERIOD,
+                     help="longest tried ticks between cars")
+    rmp.add_argument("--json", action="store_true")
+    rmp.add_argument("--physics-backend", default=None,
+                     choices=available_backends())
+    alloc = commands.add_parser("allocs", help="check the python allocations "
+                                               "of the simulation tick")
+    alloc.add_argument("--save", default=allocations.ALLOC_SAVE)
+    alloc.add_argument("--ticks", type=int, default=allocations.TICKS)
+    alloc.add_argument("--tick-budget", type=float,
+                       default=allocations.TICK_BUDGET,
+                       help="mean bytes a tick may allocate")
+    alloc.add_argument("--retained-budget", type=float,
+                       default=allocations.RETAINED_BUDGET,
+                       help="bytes a tick may leave allocated")
+    alloc.add_argument("--gc-budget", type=float,
+                       default=allocations.GC_BUDGET,
+                       help="containers a tick may add to the garbage "
+                            "collector")
+    alloc.add_argument("--physics-backend", default=None,
+                       choices=available_backends())
+    gold = commands.add_parser("golden", help="record or check the golden "
+                                              "physics traces")
+    gold.add_argument("action", choices=("record", "check"))
+    gold.add_argument("saves", nargs="*", help="savegames, by default the "
+                                               "shipped levels and designs")
+    gold.add_argument("--ticks", type=int, default=None,
+                      help="length of recorded traces")
+    gold.add_argument("--position-tol", type=float, default=1.0,
+                      help="allowed node drift in pixels")
+    gold.add_argument("--failure-tick-tol", type=int, default=0,
+                      help="allowed shift of beam failures in ticks")
+    gold.add_argument("--death-tol", type=int, default=0,
+                      help="allowed difference of the death toll")
+    gold.add_argument("--physics-backend", default=None,
+                      choices=available_backends())
+    args = parser.parse_args(argv)
+    if args.command == "golden":
+        return golden(args)
+    if args.command == "export":
+        return export_video(args)
+    if args.command == "allocs":
+        return allocs(args)
+    if args.command == "ramp":
+        return ramp(args)
+    try:
+        save_name = None if args.save is None else \
+            save_name_from_path(args.save)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    # the game's own messages go to stderr so stdout only holds the result
+    with contextlib.redirect_stdout(sys.stderr):
+        game = setup_game(args.physics_backend)
+        if args.delta_t is not None:
+            game.delta_t = args.delta_t
+        game.car_substeps = args.car_substeps
+        result = simulate(game, levels[args.level], save_name, args.speed,
+                          args.max_ticks)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key}: {value}")
+    return 0 if result["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
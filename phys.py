@@ -1,5 +1,6 @@
 import pygame
 import math
+from registry import EntityRegistry
 from constants import *
 
 
@@ -35,12 +36,24 @@ class Beam(pygame.sprite.Sprite):
                    "cost": 0, "preload": 1}}
     show_hidden = False
     show_force_colors = True
+    static_layer = False  # beams between anchored nodes are drawn by a cache
+    swept_collisions = True
     last_built = None
     game = None
-    paved_beams = pygame.sprite.Group()
-    beams = pygame.sprite.Group()
+    beams = EntityRegistry(tags={
+        "solid": lambda beam: beam.properties["is_solid"],
+        "saved": lambda beam: beam.for_saving,
+        "player": lambda beam: beam.for_saving and beam.type != "ground",
+        "car": lambda beam: beam.type in ("car_spring", "car_frame")})
+    paved_beams = beams.tagged("solid")
+    FORCE_LEVELS = 64  # number of shades in a force color palette
+    force_palettes = {}
+    draw_batches = {}
+    line_start = [0, 0]  # reused end points of the drawn lines
+    line_end = [0, 0]
 
-    def __init__(self, node1, node2, curr_type="normal", base_length=None):
+    def __init__(self, node1, node2, curr_type="normal", base_length=None,
+                 beam_id=None):
         """
         creates a Beam object between two nodes, retrieves and stores properties
         from the property sets dict, stores references to nodes for updating
@@ -49,6 +62,8 @@ class Beam(pygame.sprite.Sprite):
         :param node2:
         :param curr_type:
         :param base_length:
+        :param beam_id: stable id of a loaded beam, new beams get one from
+        the registry
         """
         super().__init__()
         self.type = curr_type
@@ -61,6 +76,7 @@ class Beam(pygame.sprite.Sprite):
         self.max_force = self.properties["max_force"]
         self.fail_anim_len = self.properties["fail_anim_len"]
         self.def_color = self.color = self.properties["color"]
+        self.palette = Beam.get_force_palette(self.def_color[2])
 
         self.node1 = node1
         self.node2 = node2
@@ -77,9 +93,9 @@ class Beam(pygame.sprite.Sprite):
             self.base_length = self.curr_length = base_length
 
         self.base_length *= self.properties["preload"]
+        self.rest_length = self.base_length
 
-        if Beam.property_sets[self.type]["is_solid"]:
-            self.add(Beam.paved_beams)
+        self.id = beam_id  # stable id, given by the registry if None
         self.add(Beam.beams)
         if node1.x == node2.x and node1.y == node2.y:
             self.delete_beam()
@@ -93,27 +109,118 @@ class Beam(pygame.sprite.Sprite):
         """
         if self.node1.for_del or self.node2.for_del:
             self.delete_beam()
-        elif self.breaking != 0:  # rendering simple breaking animation
+        elif self.breaking != 0:  # counting down the breaking animation
             self.breaking -= 1
-            pygame.draw.line(Beam.game.screen, WHITE, self.node1.center,
-                             self.node2.center,
-                             self.fail_anim_len - self.breaking)
             if self.breaking <= 0:
                 self.delete_beam(False)
         else:  # normal element behaviour
             if self.max_force is not None:
-                self.dx = abs(self.node1.x - self.node2.x)
-                self.dy = abs(self.node1.y - self.node2.y)
-                if self.dx != 0 or self.dy != 0:
-                    self.update_physics()  # preventing div by 0 errors
+                if not Beam.game.backend.batched and not self.substepped():
+                    self.dx = abs(self.node1.x - self.node2.x)
+                    self.dy = abs(self.node1.y - self.node2.y)
+                    if self.dx != 0 or self.dy != 0:
+                        self.update_physics()  # preventing div by 0 errors
                 if Beam.game.gamemode == "simulation":
                     self.check_for_failure()
                 if Beam.show_force_colors:
                     self.paint_force_colors()
-            if self.is_vis or Beam.show_hidden:
-                pygame.draw.line(Beam.game.screen, self.color,
-                                 self.node1.center, self.node2.center,
-                                 self.thickness)
+
+    def substepped(self):
+        """
+        checks whether the beam is a car beam whose forces are computed by
+        its car's own substeps instead of once per tick
+        :return:
+        """
+        return Beam.game.car_substeps > 1 and self in Beam.beams.tagged("car")
+
+    @classmethod
+    def physics_beams(cls):
+        """
+        returns the beams whose forces are computed this tick, used by
+        batched physics backends
+        :return:
+        """
+        return [beam for beam in cls.beams
+                if beam.max_force is not None and beam.breaking == 0 and
+                not beam.substepped() and
+                not beam.node1.for_del and not beam.node2.for_del and
+                (beam.node1.x != beam.node2.x or
+                 beam.node1.y != beam.node2.y)]
+
+    def is_static(self):
+        """
+        checks whether the beam can not move, both of its nodes are anchored
+        and it is not breaking
+        :return:
+        """
+        return self.breaking == 0 and self.node1.anchored and \
+            self.node2.anchored
+
+    @classmethod
+    def draw_beams(cls, static=None, surface=None):
+        """
+        the beam render pass, separate from the physics update. beams are
+        grouped by color and thickness so every style is drawn in one go. the
+        batch lists and the two line end points are kept between frames, so
+        a frame allocates nothing per beam
+        :param static: True draws only the static beams, False only the
+            moving ones, None all of them unless static_layer is set
+        :param surface: drawn onto, the screen by default
+        :return:
+        """
+        if static is None and Beam.static_layer:
+            static = False
+        if surface is None:
+            surface = Beam.game.screen
+        batches = Beam.draw_batches  # color -> thickness -> beams
+        for by_thickness in batches.values():
+            for batch in by_thickness.values():
+                batch.clear()
+        for beam in Beam.beams:
+            if beam.breaking != 0:  # simple breaking animation
+                color = WHITE
+                thickness = beam.fail_anim_len - beam.breaking
+            elif beam.is_vis or Beam.show_hidden:
+                color = beam.color
+                thickness = beam.thickness
+            else:
+                continue
+            if static is not None and beam.is_static() != static:
+                continue
+            by_thickness = batches.get(color)
+            if by_thickness is None:
+                by_thickness = batches[color] = {}
+            batch = by_thickness.get(thickness)
+            if batch is None:
+                batch = by_thickness[thickness] = []
+            batch.append(beam)
+        draw_line = pygame.draw.line
+        start = Beam.line_start
+        end = Beam.line_end
+        for color, by_thickness in batches.items():
+            for thickness, batch in by_thickness.items():
+                for beam in batch:
+                    start[0] = beam.node1.x
+                    start[1] = beam.node1.y
+                    end[0] = beam.node2.x
+                    end[1] = beam.node2.y
+                    draw_line(surface, color, start, end, thickness)
+
+    def reset(self):
+        """
+        restores a recycled beam to its rest state and adds it back to the
+        simulation, used by pooled car frames
+        :return:
+        """
+        self.dx = abs(self.node1.x - self.node2.x)
+        self.dy = abs(self.node1.y - self.node2.y)
+        self.Fx = 0
+        self.Fy = 0
+        self.F_total = 0
+        self.breaking = 0
+        self.base_length = self.curr_length = self.rest_length
+        self.color = self.def_color
+        self.add(Beam.beams)
 
     def update_physics(self):
         """
@@ -148,37 +255,116 @@ class Beam(pygame.sprite.Sprite):
         """
         checks for collisions with a car wheel node, called from the car object.
         updates the forces on the wheel and its nodes using simple analytic
-        geometry
+        geometry, wheels that moved through the beam since the last tick are
+        caught by a swept test. the swept test only runs for wheels that are
+        below the beam now or that passed one of its ends, a wheel above the
+        beam cannot have gone through it
         :param colliding_node:
         :return:
         """
-        if min(self.node1.x, self.node2.x) <= colliding_node.x <= max(
-                self.node1.x, self.node2.x):
-            xc = colliding_node.x
+        x1 = self.node1.x
+        x2 = self.node2.x
+        xc = colliding_node.x
+        if x1 < x2:
+            left, right = x1, x2
+        else:
+            left, right = x2, x1
+        if left <= xc <= right:
             yc = colliding_node.y
-            a_coefficient = (self.node1.y - self.node2.y) / (
-                    self.node1.x - self.node2.x)
+            a_coefficient = (self.node1.y - self.node2.y) / (x1 - x2)
             y_diff = abs(self.thickness * self.dx / self.curr_length)
-            if yc + y_diff > a_coefficient * (
-                    xc - self.node1.x) + self.node1.y > yc - y_diff * 2:
-                x_diff = abs(self.thickness * self.dy / self.curr_length)
-                xd = ((a_coefficient *
-                      (a_coefficient * self.node1.x + yc - self.node1.y) + xc)
-                      / (a_coefficient ** 2 + 1))
-                yd = a_coefficient * (xd - self.node1.x) + self.node1.y
-                colliding_node.y = yd - y_diff * 1.1
-                self.node1.Fy += colliding_node.Fy * abs(
-                    (self.node1.x - xc) / self.dx)
-                self.node2.Fy += colliding_node.Fy * abs(
-                    (self.node2.x - xc) / self.dx)
-                if a_coefficient < 0:
-                    colliding_node.x = xd - x_diff * 1.1
-                else:
-                    colliding_node.x = xd + x_diff * 1.1
-                colliding_node.Fy = 0
+            line_y = a_coefficient * (xc - x1) + self.node1.y
+            if yc + y_diff > line_y > yc - y_diff * 2:
+                self.resolve_collision(colliding_node, xc, yc, a_coefficient,
+                                       y_diff)
                 return True
+            if line_y >= yc + y_diff:
+                return False  # above the beam, it cannot have gone through
+        elif colliding_node.prev_x < left and xc < left or \
+                colliding_node.prev_x > right and xc > right:
+            return False  # the wheel did not pass over the beam at all
+        if Beam.swept_collisions:
+            return self.collide_swept(colliding_node)
         return False
 
+    def collide_swept(self, colliding_node):
+        """
+        continuous collision test for a wheel moving against the moving beam.
+        the wheel and both beam nodes are interpolated linearly between their
+        previous and current positions, if the wheel went from above the beam
+        to below its collision band the time of impact is found where it
+        crossed the beam line and the wheel is resolved at that point
+        :param colliding_node:
+        :return:
+        """
+        x1 = self.node1.x
+        x2 = self.node2.x
+        xc = colliding_node.x
+        pxc = colliding_node.prev_x
+        if max(xc, pxc) < min(x1, x2) or min(xc, pxc) > max(x1, x2):
+            return False  # the wheel did not pass over the beam at all
+        y1 = self.node1.y
+        y2 = self.node2.y
+        if x1 == x2 or self.curr_length == 0:
+            return False
+        px1 = self.node1.prev_x
+        py1 = self.node1.prev_y
+        px2 = self.node2.prev_x
+        py2 = self.node2.prev_y
+        if px1 == px2:
+            return False
+        yc = colliding_node.y
+        pyc = colliding_node.prev_y
+        y_diff = abs(self.thickness * self.dx / self.curr_length)
+        # vertical distance of the wheel above the beam line, y grows down
+        prev_dist = py1 + (py2 - py1) * (pxc - px1) / (px2 - px1) - pyc
+        dist = y1 + (y2 - y1) * (xc - x1) / (x2 - x1) - yc
+        if prev_dist < y_diff or dist > -y_diff * 2:
+            return False  # not above before or not through now
+        toi = prev_dist / (prev_dist - dist)
+        x_hit = pxc + (xc - pxc) * toi
+        x1_hit = px1 + (x1 - px1) * toi
+        x2_hit = px2 + (x2 - px2) * toi
+        if not min(x1_hit, x2_hit) <= x_hit <= max(x1_hit, x2_hit):
+            return False
+        # resolve against the current beam at the impact position
+        x_hit = min(max(x_hit, min(x1, x2)), max(x1, x2))
+        a_coefficient = (y1 - y2) / (x1 - x2)
+        y_hit = a_coefficient * (x_hit - x1) + y1
+        if colliding_node.vy > 0:
+            colliding_node.vy = 0
+        self.resolve_collision(colliding_node, x_hit, y_hit, a_coefficient,
+                               y_diff)
+        return True
+
+    def resolve_collision(self, colliding_node, xc, yc, a_coefficient,
+                          y_diff):
+        """
+        pushes a colliding wheel out of the beam and passes its weight onto
+        the beam nodes
+        :param colliding_node:
+        :param xc: x of the contact
+        :param yc: y of the contact
+        :param a_coefficient: slope of the beam
+        :param y_diff: vertical half-thickness of the beam
+        :return:
+        """
+        x_diff = abs(self.thickness * self.dy / self.curr_length)
+        xd = ((a_coefficient *
+              (a_coefficient * self.node1.x + yc - self.node1.y) + xc)
+              / (a_coefficient ** 2 + 1))
+        yd = a_coefficient * (xd - self.node1.x) + self.node1.y
+        colliding_node.y = yd - y_diff * 1.1
+        self.node1.Fy += colliding_node.Fy * abs(
+            (self.node1.x - xc) / self.dx)
+        self.node2.Fy += colliding_node.Fy * abs(
+            (self.node2.x - xc) / self.dx)
+        if a_coefficient < 0:
+            colliding_node.x = xd - x_diff * 1.1
+        else:
+            colliding_node.x = xd + x_diff * 1.1
+        colliding_node.Fy = 0
+
     def paint_force_colors(self):
         """
         blends the beam color based on the forces its exerting on nodes
@@ -187,20 +373,31 @@ class Beam(pygame.sprite.Sprite):
         green - tension
         :return:
         """
+        ratio = abs(self.F_total) / self.max_force * 1.2
+        if ratio >= 1:
+            level = Beam.FORCE_LEVELS - 1
+        else:
+            level = int(ratio * (Beam.FORCE_LEVELS - 1))
         if self.base_length > self.curr_length:
-            if abs(self.F_total) / self.max_force * 1.2 >= 1:
-                self.color = (255, 0, self.def_color[2])
-            else:
-                self.color = (
-                    int(abs(self.F_total / self.max_force) * 1.2 * 255), 0,
-                    self.def_color[2])
+            self.color = self.palette[0][level]
         else:
-            if abs(self.F_total) / self.max_force * 1.2 >= 1:
-                self.color = (0, 255, self.def_color[2])
-            else:
-                self.color = (
-                    0, int(abs(self.F_total / self.max_force) * 1.2 * 255),
-                    self.def_color[2])
+            self.color = self.palette[1][level]
+
+    @classmethod
+    def get_force_palette(cls, blue):
+        """
+        returns the lookup tables of quantised compression and tension colors
+        for a given blue component, the tuples are shared by all beams
+        :param blue:
+        :return:
+        """
+        if blue not in Beam.force_palettes:
+            shades = [int(i / (Beam.FORCE_LEVELS - 1) * 255)
+                      for i in range(Beam.FORCE_LEVELS)]
+            Beam.force_palettes[blue] = (
+                tuple((shade, 0, blue) for shade in shades),
+                tuple((0, shade, blue) for shade in shades))
+        return Beam.force_palettes[blue]
 
     def check_for_failure(self):
         """
@@ -210,6 +407,8 @@ class Beam(pygame.sprite.Sprite):
         """
         if self.breaking == 0 and self.F_total > self.max_force:
             self.breaking = self.fail_anim_len
+            if self.for_saving:
+                Beam.game.beam_failures += 1
 
     def delete_beam(self, refundable=True):
         """
@@ -228,11 +427,13 @@ class Beam(pygame.sprite.Sprite):
         basically a named tuple for storing saved beam values
         """
 
-        def __init__(self, node1_id, node2_id, beam_type, base_length):
+        def __init__(self, node1_id, node2_id, beam_type, base_length,
+                     beam_id):
             self.id1 = node1_id
             self.id2 = node2_id
             self.type = beam_type
             self.base_length = base_length
+            self.id = beam_id
 
     def save_beam(self):
         """
@@ -243,7 +444,7 @@ class Beam(pygame.sprite.Sprite):
             return Beam.SavedBeam(self.node1.id, self.node2.id, self.type,
                                   self.base_length *
                                   (1 / Beam.property_sets[self.type][
-                                      "preload"]))
+                                      "preload"]), self.id)
         else:
             return None
 
@@ -286,6 +487,8 @@ class Node(pygame.sprite.Sprite):
                    "radius": 11, "def_color": ORANGE, "hil_color": MAGENTA,
                    "anchored": True, "window_coll": False}}
     DEL_RANGE = 200
+    DECAY = 0.99  # velocity kept per tick of DECAY_DELTA_T when damped
+    DECAY_DELTA_T = 0.1
 
     is_gravity_on = True
     is_frozen = False
@@ -296,9 +499,12 @@ class Node(pygame.sprite.Sprite):
     temp_node = None
 
     game = None
-    nodes = pygame.sprite.Group()
+    nodes = EntityRegistry(tags={
+        "free": lambda node: not node.anchored,
+        "anchored": lambda node: node.anchored})
 
-    def __init__(self, center, curr_type="normal", def_fg=None, mass=None):
+    def __init__(self, center, curr_type="normal", def_fg=None, mass=None,
+                 node_id=None):
         """
         creates aa Node object at a position center, loads values from the
         property sets dict based on the type
@@ -306,9 +512,11 @@ class Node(pygame.sprite.Sprite):
         :param curr_type:
         :param def_fg:
         :param mass:
+        :param node_id: stable id of a loaded node, new nodes get one from
+        the registry
         """
         super().__init__()
-        self.id = None  # used for data serialization when saving game-state
+        self.id = node_id  # used for data serialization when saving game-state
         self.type = curr_type
         self.properties = Node.property_sets[self.type]
         self.is_vis = self.properties["is_vis"]
@@ -328,9 +536,10 @@ class Node(pygame.sprite.Sprite):
                 self.mass = mass
         self.for_del = False
         self.color = self.def_color
-        self.center = center
         self.x = center[0]
         self.y = center[1]
+        self.prev_x = self.x  # position before the last integration step,
+        self.prev_y = self.y  # used for swept collisions
         self.vx = 0
         self.vy = 0
         self.Fx = 0
@@ -340,6 +549,64 @@ class Node(pygame.sprite.Sprite):
         if self.type not in ("car_wheel", "car_custom", "car_light"):
             self.add(Node.nodes)
 
+    def reset(self, center):
+        """
+        puts a recycled node back at rest at a new position, used by pooled
+        car frames
+        :param center:
+        :return:
+        """
+        self.for_del = False
+        self.color = self.def_color
+        self.x = center[0]
+        self.y = center[1]
+        self.prev_x = self.x
+        self.prev_y = self.y
+        self.vx = 0
+        self.vy = 0
+        self.Fx = 0
+        self.Fy = self.Fg
+        self.Ftx = 0
+        self.Fty = 0
+
+    @property
+    def center(self):
+        """
+        the position as a tuple, only built when something reads it so the
+        simulation tick does not allocate one per node
+        :return:
+        """
+        return self.x, self.y
+
+    @center.setter
+    def center(self, center):
+        self.x = center[0]
+        self.y = center[1]
+
+    def hit(self, position):
+        """
+        checks whether a position is close enough to pick the node
+        :param position:
+        :return:
+        """
+        return (position[0] - self.x) ** 2 + (
+            position[1] - self.y) ** 2 <= self.radius ** 2 * 3
+
+    @classmethod
+    def node_at(cls, position):
+        """
+        returns the shown node at a position or None, when nodes overlap the
+        one drawn last (on top) is picked like when hovering
+        :param position:
+        :return:
+        """
+        picked = None
+        for node in Node.nodes:
+            if not node.for_del and (node.is_vis or Node.show_hidden) and \
+                    node.hit(position):
+                picked = node
+        return picked
+
     def check_mouse(self, mouse):
         """
         checks for collision with the mouse, updates the reference last_node
@@ -347,34 +614,38 @@ class Node(pygame.sprite.Sprite):
         :param mouse:
         :return:
         """
-        if (mouse[0] - self.x) ** 2 + (
-                mouse[1] - self.y) ** 2 <= self.radius ** 2 * 3:
+        if self.hit(mouse):
             self.color = self.hil_color
             Node.last_node = self
         else:
             self.color = self.def_color
 
-    def update(self, mouse, delta_t=0.1):
+    def update(self, mouse, delta_t=0.1, decay=None):
         """
         handles updating for the node objects, the delta_t argument regulates
         the speed & time resolution of the simulation at a given framerate
         :param mouse:
         :param delta_t:
+        :param decay: Node.step_decay of delta_t, computed here if not given
         :return:
         """
         if self.for_del:
             self.kill()
+        if Node.game.backend.batched:  # integrated by the backend instead
+            self.draw(mouse)
+            return
         if not self.anchored:
-            self.update_physics(delta_t)
-        self.center = (self.x, self.y)
-        if self.is_vis or Node.show_hidden:
-            self.check_mouse(mouse)
-            pygame.draw.circle(Node.game.screen, self.color, self.center,
-                               self.radius)
-        if Node.show_force_lines:
-            pygame.draw.line(Node.game.screen, GRAY, self.center,
-                             (self.x + self.Fx, self.y + self.Fy), 1)
-        # resetting the forces for the next simulation tick:
+            if decay is None:
+                decay = Node.step_decay(delta_t)
+            self.update_physics(delta_t, decay)
+        self.draw(mouse)
+        self.reset_forces()
+
+    def reset_forces(self):
+        """
+        resets the forces for the next simulation tick
+        :return:
+        """
         self.Fx = 0
         if Node.is_gravity_on:
             self.Fy = self.Fg
@@ -384,27 +655,57 @@ class Node(pygame.sprite.Sprite):
             self.vx = 0
             self.vy = 0
 
-    def update_physics(self, delta_t):
+    def draw(self, mouse):
+        """
+        draws the node and its force line, also checks for mouse hover
+        :param mouse:
+        :return:
+        """
+        if not Node.game.draw_enabled:
+            return
+        if self.is_vis or Node.show_hidden:
+            self.check_mouse(mouse)
+            pygame.draw.circle(Node.game.screen, self.color, (self.x, self.y),
+                               self.radius)
+        if Node.show_force_lines:
+            pygame.draw.line(Node.game.screen, GRAY, (self.x, self.y),
+                             (self.x + self.Fx, self.y + self.Fy), 1)
+
+    @classmethod
+    def step_decay(cls, delta_t):
+        """
+        returns the velocity kept by a damped node over a step, scaled so
+        shorter steps (car substeps) damp the same. the callers compute it
+        once per step instead of once per node
+        :param delta_t:
+        :return:
+        """
+        return Node.DECAY ** (delta_t / Node.DECAY_DELTA_T)
+
+    def update_physics(self, delta_t, decay):
         """
         updates the nodes velocity based on its mass and currently acting forces
         also includes a friction and damping component to stabilize the sim
         :param delta_t:
+        :param decay: Node.step_decay of delta_t
         :return:
         """
         self.Ftx = self.vx * abs(self.vx) * self.damp_factor
         self.Fty = self.vy * abs(self.vy) * self.damp_factor
         if abs(self.Ftx) > abs(self.Fx):
-            self.vx *= 0.99
+            self.vx *= decay
         else:
             self.vx += (self.Fx - self.Ftx) / self.mass * delta_t
         if abs(self.Fty) > abs(self.Fy):
-            self.vy *= 0.99
+            self.vy *= decay
         else:
             self.vy += (self.Fy - self.Fty) / self.mass * delta_t
         if self.vx < 0.01:
-            self.vx *= 0.99
+            self.vx *= decay
         if self.vy < 0.01:
-            self.vy *= 0.99
+            self.vy *= decay
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.x += self.vx * delta_t
         self.y += self.vy * delta_t
         if self.collideable_with_game_window:
@@ -0,0 +1,160 @@
+import multiprocessing
+import queue
+
+DEBOUNCE_MS = 400  # quiet time after an edit before the design is re-run
+REPORT_EVERY = 100  # ticks between progress reports of a running prediction
+MAX_TICKS = 30000
+MAX_FAILURES = 20  # failing beams reported per prediction
+
+
+class Prediction:
+    """
+    the latest known outcome of a design, sent from the worker process while
+    the run is in progress and once more when it ended
+    """
+
+    def __init__(self, job_id, tick, deaths, failed_beams, done, result=None):
+        """
+        :param job_id: the submission this belongs to
+        :param tick: simulation tick the run reached
+        :param deaths: death toll so far
+        :param failed_beams: stable ids of the saved beams that failed, in
+            the order they failed
+        :param done: True once the car schedule ended
+        :param result: "success", "failure" or "timeout" when done
+        """
+        self.job_id = job_id
+        self.tick = tick
+        self.deaths = deaths
+        self.failed_beams = failed_beams
+        self.done = done
+        self.result = result
+
+
+def next_job(jobs, block):
+    """
+    returns the newest job in the queue, older ones are stale and dropped
+    :param jobs:
+    :param block: wait for a job if there is none
+    :return: the job or None
+    """
+    job = None
+    try:
+        job = jobs.get(block)
+        while True:
+            job = jobs.get_nowait()
+    except queue.Empty:
+        return job
+
+
+def run_predictions(jobs, results):
+    """
+    the worker process loop, runs every submitted design through its level's
+    car pool without a display and streams Prediction objects back. a newer
+    submission cancels the running one
+    :param jobs: queue of (job id, level name, snapshot)
+    :param results: queue for Prediction objects
+    :return:
+    """
+    from mostex import setup_game
+    from levels import levels
+    from phys import Beam, Node
+    game = setup_game()
+    job = next_job(jobs, True)
+    while True:
+        job_id, level_name, snapshot = job
+        level = levels[level_name]
+        game.budget = level.budget
+        game.car_pool = level.car_pool
+        game.load_snapshot(snapshot)
+        beams = Beam.beams.tagged("saved").sprites()
+        failed = []
+        game.state = "normal"
+        game.gamemode = "simulation"
+        Node.is_gravity_on = True
+        Node.is_frozen = False
+        game.start_car_schedule()
+        job = None
+        while game.state == "normal" and game.sim_tick < MAX_TICKS:
+            game.step((0, 0), draw=False)
+            for beam in beams:
+                if beam.breaking == beam.fail_anim_len and \
+                        len(failed) < MAX_FAILURES:
+                    failed.append(beam.id)
+            if game.sim_tick % REPORT_EVERY == 0:
+                job = next_job(jobs, False)
+                if job is not None:
+                    break  # a newer design, this run is stale
+                results.put(Prediction(job_id, game.sim_tick,
+                                       game.death_toll, list(failed), False))
+        if job is None:
+            if game.state == "normal":
+                results.put(Prediction(job_id, game.sim_tick,
+                                       game.death_toll, failed, True,
+                                       "timeout"))
+            else:
+                results.put(Prediction(job_id, game.sim_tick,
+                                       game.final_death_toll, failed, True,
+                                       game.state))
+            job = next_job(jobs, True)
+        game.set_spawn_timer(0)
+        game.gamemode = "builder"
+        Node.is_gravity_on = False
+        Node.is_frozen = True
+
+
+class PredictionWorker:
+    """
+    a separate process with its own headless game that re-simulates designs
+    while the player keeps building, so the main loop never runs them
+    """
+
+    def __init__(self):
+        """
+        starts the worker process
+        """
+        context = multiprocessing.get_context("spawn")
+        self.jobs = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=run_predictions,
+                                       args=(self.jobs, self.results),
+                                       name="prediction-worker", daemon=True)
+        self.process.start()
+        self.job_id = 0
+
+    def submit(self, level_name, snapshot):
+        """
+        queues a design, any older one still queued or running is cancelled
+        :param level_name:
+        :param snapshot: structure snapshot from Game.snapshot_structure
+        :return: the id of the job
+        """
+        self.job_id += 1
+        self.jobs.put((self.job_id, level_name, snapshot))
+        return self.job_id
+
+    def poll(self):
+        """
+        returns the newest prediction of the latest job without waiting,
+        called once per frame
+        :return: a Prediction or None
+        """
+        latest = None
+        while True:
+            try:
+                prediction = self.results.get_nowait()
+            except queue.Empty:
+                return latest
+            if prediction.job_id == self.job_id:
+                latest = prediction
+
+    def close(self):
+        """
+        stops the worker process
+        :return:
+        """
+        if self.process.is_alive():
+            # it only holds throwaway state, and SDL would turn a SIGTERM
+            # into a quit event that nothing reads
+            self.process.kill()
+            self.process.join()
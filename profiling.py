@@ -0,0 +1,158 @@
+import cProfile
+import os
+import pstats
+import sys
+import time
+import pygame
+from phys import Beam, Node
+from cars import Car
+
+PROFILE_DIR = "profiles"
+PROFILE_FRAMES = 300
+# the functions the summary breaks the frame time down into
+TRACKED = (("Beam.update", Beam.update),
+           ("Node.update", Node.update),
+           ("Car.update", Car.update),
+           ("Beam.collide_beam", Beam.collide_beam),
+           ("Beam.draw_beams", Beam.draw_beams),
+           ("Node.draw", Node.draw),
+           ("Car.draw_car_body", Car.draw_car_body))
+
+
+def function_key(function):
+    """
+    returns the key pstats uses for a python function
+    :param function:
+    :return:
+    """
+    code = function.__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def summarize(stats, frames, seconds, header=()):
+    """
+    writes the share of the frame time spent in the tracked functions and
+    the slowest functions overall
+    :param stats: pstats.Stats of the capture
+    :param frames: captured frames
+    :param seconds: busy time of the captured frames, the shares are of it
+    :param header: extra lines put on top
+    :return: the summary text
+    """
+    lines = list(header)
+    lines.append(f"{frames} frames in {seconds:.2f} s busy, "
+                 f"{seconds / frames * 1000:.2f} ms per frame")
+    lines.append("")
+    lines.append(f"{'function':<20}{'calls':>10}{'own ms':>10}"
+                 f"{'total ms':>10}{'per frame':>11}{'share':>8}")
+    for name, function in TRACKED:
+        calls, _, own, total, _ = stats.stats.get(function_key(function),
+                                                  (0, 0, 0.0, 0.0, None))
+        lines.append(f"{name:<20}{calls:>10}{own * 1000:>10.1f}"
+                     f"{total * 1000:>10.1f}{total / frames * 1000:>11.3f}"
+                     f"{total / seconds:>8.1%}")
+    lines.append("")
+    lines.append("slowest functions by own time:")
+    ranked = sorted(stats.stats.items(), key=lambda item: item[1][2],
+                    reverse=True)
+    for (filename, line, name), (calls, _, own, total, _) in ranked[:15]:
+        lines.append(f"  {own * 1000:9.1f} ms {calls:>9} calls  "
+                     f"{os.path.basename(filename)}:{line}({name})")
+    return "\n".join(lines) + "\n"
+
+
+class FrameProfiler:
+    """
+    captures a number of whole frames with cProfile and writes the raw
+    .pstats file and a short text summary into the profiles directory, so
+    slow frames can be examined without changing any code
+    """
+
+    def __init__(self, game, directory=PROFILE_DIR):
+        """
+        :param game:
+        :param directory:
+        """
+        self.game = game
+        self.directory = directory
+        self.profile = None
+        self.frames_left = 0
+        self.frames = 0
+        self.started = 0
+        self.paused = 0  # seconds the capture spent paused
+        self.pause_started = None
+
+    def start(self, frames=PROFILE_FRAMES):
+        """
+        starts a capture of the next frames, ignored while one is running
+        :param frames:
+        :return:
+        """
+        if self.profile is not None:
+            return
+        print(f"profiling {frames} frames")
+        self.frames_left = self.frames = frames
+        self.started = time.perf_counter()
+        self.paused = 0
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def capturing(self):
+        """
+        checks whether a capture is running
+        :return:
+        """
+        return self.profile is not None
+
+    def pause(self):
+        """
+        stops profiling until resume, used around the fps limiter so its
+        sleep is not part of the capture
+        :return:
+        """
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.pause_started = time.perf_counter()
+
+    def resume(self):
+        """
+        continues a capture after pause
+        :return:
+        """
+        if self.profile is None or self.pause_started is None:
+            return
+        self.paused += time.perf_counter() - self.pause_started
+        self.pause_started = None
+        self.profile.enable()
+
+    def frame_done(self):
+        """
+        counts a finished frame and writes the results after the last one,
+        called at the end of every frame
+        :return:
+        """
+        if self.profile is None:
+            return
+        self.frames_left -= 1
+        if self.frames_left > 0:
+            return
+        self.profile.disable()
+        # busy time of the frames, without the waits between them
+        seconds = time.perf_counter() - self.started - self.paused
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.game.base_levelname}_{time.strftime('%Y%m%d_%H%M%S')}"
+        path = os.path.join(self.directory, name)
+        self.profile.dump_stats(path + ".pstats")
+        header = (f"level {self.game.base_levelname}, {self.game.gamemode} "
+                  f"mode, {len(Node.nodes)} nodes, {len(Beam.beams)} beams, "
+                  f"{len(Car.cars)} cars",
+                  f"physics backend {self.game.backend.name}, python "
+                  f"{sys.version.split()[0]}, pygame {pygame.version.ver}")
+        summary = summarize(pstats.Stats(self.profile), self.frames, seconds,
+                            header)
+        with open(path + ".txt", "w") as f:
+            f.write(summary)
+        print(f"profile written to '{path}.pstats'")
+        print(summary)
+        self.profile = None
@@ -0,0 +1,122 @@
+import pygame
+from phys import Beam
+from cars import Car
+from ui_prefabs import DataDisplay
+from constants import *
+
+
+class QualityGovernor:
+    """
+    watches the measured frame time and degrades the presentation one step
+    at a time when the game can not keep up, every step is restored again
+    once there is enough headroom. the simulation itself is never changed,
+    a run gives the same result on any machine
+    """
+    STEPS = ("full quality",
+             "no force colors",
+             "coarse car rotation",
+             "cached static layer",
+             "half-rate drawing")
+    SMOOTHING = 0.05  # weight of the newest frame in the moving average
+    DEGRADE_LOAD = 0.95  # share of the frame budget that triggers degrading
+    RESTORE_LOAD = 0.6  # share of the frame budget that allows restoring
+    HOLD_FRAMES = 60  # frames to wait after a change before the next one
+    COARSE_ROTATION = 10  # degrees per rotated car image when degraded
+
+    def __init__(self, game, position=(10, 760)):
+        """
+        creates the governor and its ui display at full quality
+        :param game:
+        :param position:
+        """
+        self.game = game
+        self.level = 0
+        self.frame_budget = 1000 / SET_FPS
+        self.avg_frame_time = 0
+        self.hold = QualityGovernor.HOLD_FRAMES
+        self.frame_index = 0
+        self.force_colors = Beam.show_force_colors
+        self.static_layer = None  # see draw_background
+        self.display = DataDisplay(position, 300, 40, "", WHITE)
+        self.apply()
+
+    def update(self, frame_time, hold=False):
+        """
+        feeds the busy time of the last frame (without the fps limiter delay)
+        into the moving average and changes the quality level if needed
+        :param frame_time: milliseconds spent on the last frame
+        :param hold: only counts the frame, the frame time is not
+            representative (e.g. while profiling) and the level stays
+        :return:
+        """
+        self.frame_index += 1
+        if hold:
+            return
+        self.avg_frame_time += (frame_time - self.avg_frame_time) * \
+            QualityGovernor.SMOOTHING
+        if self.hold > 0:
+            self.hold -= 1
+            return
+        load = self.avg_frame_time / self.frame_budget
+        if load > QualityGovernor.DEGRADE_LOAD and \
+                self.level < len(QualityGovernor.STEPS) - 1:
+            self.level += 1
+            self.apply()
+        elif load < QualityGovernor.RESTORE_LOAD and self.level > 0:
+            self.level -= 1
+            self.apply()
+
+    def apply(self):
+        """
+        sets the presentation options for the current quality level and
+        shows the level on the display
+        :return:
+        """
+        self.hold = QualityGovernor.HOLD_FRAMES
+        if self.level >= 1:
+            Beam.show_force_colors = False
+        else:
+            Beam.show_force_colors = self.force_colors
+        if self.level >= 2:
+            Car.rotation_step = QualityGovernor.COARSE_ROTATION
+        else:
+            Car.rotation_step = 0
+        Beam.static_layer = self.level >= 3
+        if not Beam.static_layer:
+            self.static_layer = None
+        if self.level == 0:
+            self.display.display_data("")
+        else:
+            self.display.display_data(
+                f"quality -{self.level}: {QualityGovernor.STEPS[self.level]}")
+
+    def draw_background(self):
+        """
+        clears the screen to the level background at the start of a drawn
+        frame. at reduced quality the background and the beams between
+        anchored nodes are prerendered into a cached layer that is blitted
+        every frame and only rebuilt every other frame, Beam.draw_beams then
+        leaves those beams out
+        :return:
+        """
+        screen = self.game.screen
+        if not Beam.static_layer:
+            screen.fill(BLACK)
+            screen.blit(self.game.background, self.game.window)
+            return
+        if self.static_layer is None or self.frame_index % 2 == 0:
+            if self.static_layer is None:
+                self.static_layer = pygame.Surface(
+                    screen.get_size()).convert()
+            self.static_layer.fill(BLACK)
+            self.static_layer.blit(self.game.background, self.game.window)
+            Beam.draw_beams(static=True, surface=self.static_layer)
+        screen.blit(self.static_layer, (0, 0))
+
+    def draw_frame(self):
+        """
+        checks whether this frame is drawn, at the lowest quality every
+        other frame only runs the simulation tick
+        :return:
+        """
+        return self.level < 4 or self.frame_index % 2 == 0
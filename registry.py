@@ -0,0 +1,154 @@
+import pygame
+
+
+class EntityView:
+    """
+    a live, read only set of the registered entities that have a tag, kept
+    up to date by the registry so queries never scan all entities
+    """
+
+    def __init__(self):
+        self.entities = {}  # insertion ordered like the registry itself
+        self.members = None  # cached tuple of the entities
+
+    def __iter__(self):
+        if self.members is None:
+            self.members = tuple(self.entities)
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __bool__(self):
+        return bool(self.entities)
+
+    def __contains__(self, entity):
+        return entity in self.entities
+
+    def sprites(self):
+        return list(self.entities)
+
+
+class SnapshotGroup(pygame.sprite.Group):
+    """
+    a sprite group that keeps a tuple of its members between membership
+    changes, iterating and updating it in a tick where nothing was added or
+    removed allocates no new member list. members can still be removed while
+    iterating, the loop keeps going over the old tuple
+    """
+
+    def __init__(self, *sprites):
+        self.members = None
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.members = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.members = None
+
+    def snapshot(self):
+        """
+        returns the members as a tuple, shared until the membership changes
+        :return:
+        """
+        if self.members is None:
+            self.members = tuple(self.spritedict)
+        return self.members
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def update(self, *args, **kwargs):
+        for sprite in self.snapshot():
+            sprite.update(*args, **kwargs)
+
+
+class EntityRegistry(SnapshotGroup):
+    """
+    a sprite group that also gives every entity a stable id and a
+    generational handle and keeps tag indices for type queries. ids survive
+    removal and re-adding (undo) and are written into saves, so they stay the
+    same across saves, loads and snapshots. an entity whose id was taken by
+    another one while it was removed gets a new id. handles are (slot, generation)
+    pairs, a handle of a removed entity never resolves to a newer one that
+    reused its slot. inserting, removing and looking up are O(1) and
+    iteration keeps the insertion order of the group
+    """
+
+    def __init__(self, *sprites, tags=None):
+        """
+        :param sprites: entities to add right away
+        :param tags: dict of tag name -> predicate of an entity, evaluated
+            when the entity is added
+        """
+        self.tags = dict(tags or {})
+        self.views = {tag: EntityView() for tag in self.tags}
+        self.by_id = {}
+        self.next_id = 0
+        self.slots = []  # entity in each slot, None for a free slot
+        self.generations = []
+        self.free_slots = []
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if getattr(sprite, "id", None) is None or \
+                self.by_id.get(sprite.id, sprite) is not sprite:
+            sprite.id = self.next_id
+        self.next_id = max(self.next_id, sprite.id + 1)
+        self.by_id[sprite.id] = sprite
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.slots[slot] = sprite
+        else:
+            slot = len(self.slots)
+            self.slots.append(sprite)
+            self.generations.append(0)
+        sprite.handle = (slot, self.generations[slot])
+        for tag, predicate in self.tags.items():
+            if predicate(sprite):
+                view = self.views[tag]
+                view.entities[sprite] = None
+                view.members = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        if self.by_id.get(sprite.id) is sprite:
+            del self.by_id[sprite.id]
+        slot = sprite.handle[0]
+        self.slots[slot] = None
+        self.generations[slot] += 1
+        self.free_slots.append(slot)
+        for view in self.views.values():
+            if view.entities.pop(sprite, False) is None:
+                view.members = None
+
+    def get(self, handle):
+        """
+        returns the entity of a handle, None if it was removed since
+        :param handle:
+        :return:
+        """
+        slot, generation = handle
+        if slot < len(self.slots) and self.generations[slot] == generation:
+            return self.slots[slot]
+        return None
+
+    def get_by_id(self, entity_id):
+        """
+        returns the registered entity with a stable id or None
+        :param entity_id:
+        :return:
+        """
+        return self.by_id.get(entity_id)
+
+    def tagged(self, tag):
+        """
+        returns the live view of the entities with a tag
+        :param tag:
+        :return:
+        """
+        return self.views[tag]
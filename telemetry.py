@@ -0,0 +1,217 @@
+import json
+import os
+import numpy as np
+from phys import Beam, Node
+
+
+class TelemetryRecorder:
+    """
+    streams per-tick beam forces, beam lengths and node positions and
+    velocities of a bridge into memory-mapped column files, the files grow in
+    preallocated chunks. recording a tick fills reused gather rows in place
+    and copies them as whole rows into arrays that already exist
+    """
+    BEAM_COLUMNS = ("F_total", "curr_length")
+    NODE_COLUMNS = ("x", "y", "vx", "vy")
+    DTYPE = np.float32
+
+    def __init__(self, path, chunk_ticks=4096):
+        """
+        takes a snapshot of the current structure and creates the column
+        files, only beams and nodes that exist at this point are recorded,
+        removed ones are written as NaN
+        :param path: directory for the column files, see new_run_dir
+        :param chunk_ticks: how many ticks are preallocated at once
+        """
+        self.path = path
+        self.chunk_ticks = chunk_ticks
+        self.nodes = tuple(Node.nodes)
+        self.beams = tuple(beam for beam in Beam.beams
+                           if beam.max_force is not None)
+        node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.beam_refs = tuple(enumerate(self.beams))
+        self.node_refs = tuple(enumerate(self.nodes))
+        # one row per column, filled in place every tick and then written
+        # into the mapped chunk as a whole
+        self.beam_gather = tuple(np.empty((2, len(self.beams)),
+                                          TelemetryRecorder.DTYPE))
+        self.node_gather = tuple(np.empty((4, len(self.nodes)),
+                                          TelemetryRecorder.DTYPE))
+        self.ticks = 0
+        self.chunk_start = 0
+        self.columns = {}
+        self.files = {}
+        os.makedirs(path, exist_ok=True)
+        widths = {}
+        for name in TelemetryRecorder.BEAM_COLUMNS:
+            widths["beam_" + name] = len(self.beams)
+        for name in TelemetryRecorder.NODE_COLUMNS:
+            widths["node_" + name] = len(self.nodes)
+        self.widths = widths
+        for column in widths:
+            self.files[column] = open(self.column_path(path, column), "w+b")
+        self.meta = {
+            "columns": widths,
+            "dtype": np.dtype(TelemetryRecorder.DTYPE).str,
+            "ticks": 0,
+            "beam_types": [beam.type for beam in self.beams],
+            "beam_max_force": [beam.max_force for beam in self.beams],
+            "beam_nodes": [[node_index.get(beam.node1, -1),
+                            node_index.get(beam.node2, -1)]
+                           for beam in self.beams],
+            "node_types": [node.type for node in self.nodes]}
+        self.map_chunk()
+
+    @staticmethod
+    def column_path(path, column):
+        """
+        returns the file path of a single column
+        :param path:
+        :param column:
+        :return:
+        """
+        return os.path.join(path, column + ".bin")
+
+    def map_chunk(self):
+        """
+        grows every column file by one chunk and memory-maps only that chunk
+        :return:
+        """
+        itemsize = np.dtype(TelemetryRecorder.DTYPE).itemsize
+        for column, width in self.widths.items():
+            if width == 0:
+                self.columns[column] = np.empty((self.chunk_ticks, 0),
+                                                TelemetryRecorder.DTYPE)
+                continue
+            f = self.files[column]
+            offset = self.chunk_start * width * itemsize
+            f.truncate(offset + self.chunk_ticks * width * itemsize)
+            self.columns[column] = np.memmap(
+                f, TelemetryRecorder.DTYPE, "r+", offset,
+                (self.chunk_ticks, width))
+        self.beam_force = self.columns["beam_F_total"]
+        self.beam_length = self.columns["beam_curr_length"]
+        self.node_x = self.columns["node_x"]
+        self.node_y = self.columns["node_y"]
+        self.node_vx = self.columns["node_vx"]
+        self.node_vy = self.columns["node_vy"]
+
+    def record(self):
+        """
+        writes the state of the recorded structure for the current tick
+        :return:
+        """
+        row = self.ticks - self.chunk_start
+        if row >= self.chunk_ticks:
+            self.flush()
+            self.chunk_start = self.ticks
+            self.map_chunk()
+            row = 0
+        force, length = self.beam_gather
+        for i, beam in self.beam_refs:
+            if beam.alive():
+                force[i] = beam.F_total
+                length[i] = beam.curr_length
+            else:
+                force[i] = length[i] = np.nan
+        x, y, vx, vy = self.node_gather
+        for i, node in self.node_refs:
+            if node.alive():
+                x[i] = node.x
+                y[i] = node.y
+                vx[i] = node.vx
+                vy[i] = node.vy
+            else:
+                x[i] = y[i] = vx[i] = vy[i] = np.nan
+        self.beam_force[row] = force
+        self.beam_length[row] = length
+        self.node_x[row] = x
+        self.node_y[row] = y
+        self.node_vx[row] = vx
+        self.node_vy[row] = vy
+        self.ticks += 1
+
+    def rewind(self, ticks):
+        """
+        forgets the rows after the first ticks, the next record writes the
+        tick after them. used when the simulation goes back in time
+        :param ticks: number of recorded ticks kept
+        :return:
+        """
+        if ticks >= self.ticks:
+            return
+        self.ticks = ticks
+        if ticks < self.chunk_start:  # the kept rows end in an earlier chunk
+            self.flush()
+            self.columns.clear()
+            self.chunk_start = ticks
+            self.map_chunk()
+        self.meta["ticks"] = ticks
+
+    def flush(self):
+        """
+        flushes the mapped chunk to disk and updates the metadata file
+        :return:
+        """
+        for column in self.columns.values():
+            if isinstance(column, np.memmap):
+                column.flush()
+        self.meta["ticks"] = self.ticks
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+    def close(self):
+        """
+        flushes the recording and trims the preallocated but unused ticks
+        :return:
+        """
+        self.flush()
+        itemsize = np.dtype(TelemetryRecorder.DTYPE).itemsize
+        self.columns.clear()
+        self.beam_force = self.beam_length = None
+        self.node_x = self.node_y = self.node_vx = self.node_vy = None
+        for column, f in self.files.items():
+            f.truncate(self.ticks * self.widths[column] * itemsize)
+            f.close()
+        self.files.clear()
+
+
+def new_run_dir(parent, name):
+    """
+    creates a directory for a new recording that no earlier run uses, runs
+    started within the same second get a numbered suffix
+    :param parent:
+    :param name:
+    :return: path of the created directory
+    """
+    os.makedirs(parent, exist_ok=True)
+    path = os.path.join(parent, name)
+    suffix = 1
+    while True:
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            suffix += 1
+            path = os.path.join(parent, f"{name}_{suffix}")
+
+
+def load_telemetry(path):
+    """
+    opens a recording made by TelemetryRecorder, returns the metadata and a
+    dict of read-only (ticks, width) arrays, one for every column
+    :param path:
+    :return:
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    ticks = meta["ticks"]
+    columns = {}
+    for column, width in meta["columns"].items():
+        if ticks == 0 or width == 0:
+            columns[column] = np.empty((ticks, width), meta["dtype"])
+        else:
+            columns[column] = np.memmap(
+                TelemetryRecorder.column_path(path, column), meta["dtype"],
+                "r", shape=(ticks, width))
+    return meta, columns
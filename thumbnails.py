@@ -0,0 +1,117 @@
+import hashlib
+import os
+import pygame
+from phys import Beam, Node
+from assets import AssetManager
+from catalog import read_save_file
+from constants import *
+
+THUMB_SIZE = (320, 160)
+CACHE_DIR = os.path.join(AssetManager.CACHE_DIR, "thumbnails")
+
+
+def render_thumbnail(background_file, snapshot, size=THUMB_SIZE):
+    """
+    draws a level background with a saved structure onto a small offscreen
+    surface, only touches plain surfaces so it can run on a worker thread
+    :param background_file:
+    :param snapshot: (nodes, beams, money) of a save
+    :param size:
+    :return:
+    """
+    scale = size[0] / SCREEN_WIDTH, size[1] / SCREEN_HEIGHT
+    surface = pygame.transform.smoothscale(pygame.image.load(background_file),
+                                           size)
+    nodes, beams, _ = snapshot
+    points = {node.id: (node.center[0] * scale[0], node.center[1] * scale[1])
+              for node in nodes}
+    for beam in beams:
+        properties = Beam.property_sets[beam.type]
+        color = properties["color"] if properties["is_vis"] else ORANGE
+        pygame.draw.line(surface, color, points[beam.id1], points[beam.id2],
+                         max(1, round(properties["thick"] * scale[0])))
+    for node in nodes:
+        properties = Node.property_sets[node.type]
+        if properties["is_vis"]:
+            pygame.draw.circle(surface, properties["def_color"],
+                               points[node.id],
+                               max(1, round(properties["radius"] * scale[0])))
+    return surface
+
+
+def make_thumbnail(save_path, background_file, size=THUMB_SIZE):
+    """
+    returns the thumbnail of a save, from the disk cache if the save and
+    background did not change, runs on a worker thread
+    :param save_path:
+    :param background_file:
+    :param size:
+    :return:
+    """
+    with open(save_path, "rb") as f:
+        digest = hashlib.sha1(f.read())
+    digest.update(f"{background_file}{size}".encode())
+    cache_path = os.path.join(CACHE_DIR, digest.hexdigest() + ".png")
+    if os.path.isfile(cache_path):
+        return pygame.image.load(cache_path)
+    surface = render_thumbnail(background_file, read_save_file(save_path),
+                               size)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".tmp.png"
+    pygame.image.save(surface, tmp_path)
+    os.replace(tmp_path, cache_path)
+    return surface
+
+
+class ThumbnailCache:
+    """
+    keeps the thumbnails of saves in memory, missing ones are rendered on
+    their own worker so the main loop never waits for them
+    """
+
+    def __init__(self, worker, directory="savegames"):
+        """
+        :param worker: an IOWorker used only for thumbnails
+        :param directory:
+        """
+        self.worker = worker
+        self.directory = directory
+        self.thumbnails = {}
+        self.pending = set()
+
+    def get(self, save_name, background_file, version):
+        """
+        returns the thumbnail of a save or None while it is being rendered,
+        a new version (like the save's mtime) makes it render again
+        :param save_name:
+        :param background_file:
+        :param version:
+        :return:
+        """
+        key = (save_name, background_file, version)
+        if key in self.thumbnails:
+            return self.thumbnails[key]
+        if key not in self.pending:
+            self.pending.add(key)
+            self.worker.submit(make_thumbnail,
+                               os.path.join(self.directory, save_name),
+                               background_file,
+                               callback=lambda surface, error: self.done(
+                                   key, surface, error))
+        return None
+
+    def done(self, key, surface, error):
+        """
+        worker callback for a finished thumbnail
+        :param key:
+        :param surface:
+        :param error:
+        :return:
+        """
+        self.pending.discard(key)
+        if error is not None:
+            print(f"Error rendering thumbnail of '{key[0]}': {error}")
+            surface = None  # not retried until the save changes
+        for old_key in [old for old in self.thumbnails if old[0] == key[0]]:
+            del self.thumbnails[old_key]
+        self.thumbnails[key] = surface
@@ -0,0 +1,199 @@
+from array import array
+from collections import deque
+from phys import Beam, Node
+from cars import Car
+from constants import SET_FPS
+
+KEYFRAME_EVERY = SET_FPS  # ticks between keyframes, one second of game time
+MEMORY_CAP = 32 * 1024 * 1024  # bytes of keyframes kept, the oldest go first
+NODE_FIELDS = ("x", "y", "prev_x", "prev_y", "vx", "vy", "Fx", "Fy", "Ftx",
+               "Fty")
+BEAM_FIELDS = ("dx", "dy", "curr_length", "base_length", "F_total", "Fx",
+               "Fy")
+CAR_FIELDS = ("center_x", "center_y")
+GAME_FIELDS = ("sim_tick", "next_spawn_tick", "spawn_index", "spawned_cars",
+               "death_toll", "beam_failures", "final_death_toll", "state",
+               "money", "delta_t", "car_substeps")
+NODE_FLAGS = ("is_gravity_on", "is_frozen")  # class wide switches of Node
+
+
+class Keyframe:
+    """
+    the complete simulation state at the end of one tick. the numbers of
+    nodes and beams are packed into flat arrays, entities are kept by
+    reference so ones removed later can be put back
+    """
+
+    def __init__(self, game):
+        """
+        captures the current state
+        :param game:
+        """
+        self.tick = game.sim_tick
+        self.game_values = tuple(getattr(game, field) for field in
+                                 GAME_FIELDS)
+        self.node_flags = tuple(getattr(Node, flag) for flag in NODE_FLAGS)
+        self.nodes = Node.nodes.snapshot()
+        self.beams = Beam.beams.snapshot()
+        self.cars = Car.cars.snapshot()
+        self.pool = tuple(Car.pool)
+        self.car_nodes = tuple(car.car_nodes.snapshot() for car in self.cars)
+        self.car_values = tuple(tuple(getattr(car, field) for field in
+                                      CAR_FIELDS) for car in self.cars)
+        self.all_nodes = self.nodes + tuple(
+            node for car in self.cars for node, _, _ in car.node_offsets)
+        beams = set(self.beams)
+        self.all_beams = self.beams + tuple(
+            beam for car in self.cars for beam in car.car_beams
+            if beam not in beams)
+        self.node_values = array("d", (
+            value for node in self.all_nodes for value in
+            (*(getattr(node, field) for field in NODE_FIELDS),
+             node.for_del)))
+        self.beam_values = array("d", (
+            value for beam in self.all_beams for value in
+            (*(getattr(beam, field) for field in BEAM_FIELDS),
+             beam.breaking)))
+
+    def size(self):
+        """
+        returns the approximate memory used by the keyframe in bytes
+        :return:
+        """
+        references = len(self.nodes) + len(self.beams) + len(self.pool) + \
+            len(self.all_nodes) + len(self.all_beams) + \
+            sum(len(nodes) for nodes in self.car_nodes) + \
+            len(self.car_values) * (len(CAR_FIELDS) + 1)
+        return (self.node_values.itemsize * len(self.node_values) +
+                self.beam_values.itemsize * len(self.beam_values) +
+                8 * references)
+
+    def restore(self, game, structure_only=False):
+        """
+        puts the simulation back into the captured state, group memberships
+        are only rebuilt where they changed so iteration orders stay the same
+        :param game:
+        :param structure_only: only put back the nodes, beams and money, the
+            cars, run counters, time step and gravity are left to the caller
+        :return:
+        """
+        if structure_only:
+            money = self.game_values[GAME_FIELDS.index("money")]
+            game.update_money(money - game.money)
+        else:
+            for field, value in zip(GAME_FIELDS, self.game_values):
+                setattr(game, field, value)
+            for flag, value in zip(NODE_FLAGS, self.node_flags):
+                setattr(Node, flag, value)
+            game.update_money(0)  # refreshes the displays
+            game.update_death_toll(0, game.death_toll == 0)
+        Keyframe.restore_group(Node.nodes, self.nodes)
+        Keyframe.restore_group(Beam.beams, self.beams)
+        if not structure_only:
+            Keyframe.restore_group(Car.cars, self.cars)
+            Car.pool[:] = self.pool
+            for car, nodes, values in zip(self.cars, self.car_nodes,
+                                          self.car_values):
+                Keyframe.restore_group(car.car_nodes, nodes)
+                for field, value in zip(CAR_FIELDS, values):
+                    setattr(car, field, value)
+        stride = len(NODE_FIELDS) + 1
+        for i, node in enumerate(self.all_nodes):
+            values = self.node_values[i * stride:(i + 1) * stride]
+            for field, value in zip(NODE_FIELDS, values):
+                setattr(node, field, value)
+            node.for_del = bool(values[-1])
+        stride = len(BEAM_FIELDS) + 1
+        for i, beam in enumerate(self.all_beams):
+            values = self.beam_values[i * stride:(i + 1) * stride]
+            for field, value in zip(BEAM_FIELDS, values):
+                setattr(beam, field, value)
+            beam.breaking = int(values[-1])
+
+    @staticmethod
+    def restore_group(group, members):
+        """
+        makes a group hold exactly the given members in their order
+        :param group: a SnapshotGroup
+        :param members: tuple of sprites
+        :return:
+        """
+        if group.snapshot() != members:
+            group.empty()
+            group.add(*members)
+
+
+class Timeline:
+    """
+    keeps keyframes of a running simulation in a ring buffer with a memory
+    cap and seeks to any tick after the oldest one by restoring the nearest
+    earlier keyframe and simulating forward without drawing
+    """
+
+    def __init__(self, game, every=KEYFRAME_EVERY, memory_cap=MEMORY_CAP):
+        """
+        :param game:
+        :param every: ticks between keyframes
+        :param memory_cap: bytes of keyframes kept
+        """
+        self.game = game
+        self.every = every
+        self.memory_cap = memory_cap
+        self.keyframes = deque()
+        self.memory = 0
+
+    def record(self):
+        """
+        captures a keyframe on every nth tick, called at the end of each tick
+        :return:
+        """
+        if self.game.sim_tick % self.every != 0:
+            return
+        if self.keyframes and self.keyframes[-1].tick >= self.game.sim_tick:
+            self.drop_after(self.game.sim_tick - 1)  # went back in time
+        keyframe = Keyframe(self.game)
+        self.keyframes.append(keyframe)
+        self.memory += keyframe.size()
+        while self.memory > self.memory_cap and len(self.keyframes) > 1:
+            self.memory -= self.keyframes.popleft().size()
+
+    def drop_after(self, tick):
+        """
+        forgets the keyframes after a tick
+        :param tick:
+        :return:
+        """
+        while self.keyframes and self.keyframes[-1].tick > tick:
+            self.memory -= self.keyframes.pop().size()
+
+    def earliest(self):
+        """
+        returns the earliest tick that can be sought to, None without
+        keyframes
+        :return:
+        """
+        return self.keyframes[0].tick if self.keyframes else None
+
+    def seek(self, tick):
+        """
+        moves the simulation to a tick, earlier ticks are restored from the
+        nearest keyframe and simulated forward, ticks before the oldest
+        keyframe go to the oldest one. a running telemetry recording is
+        rewound with the simulation, so the re-simulated ticks replace the
+        rows recorded for them instead of being appended again
+        :param tick:
+        :return: the tick reached
+        """
+        if tick < self.game.sim_tick and self.keyframes:
+            keyframe = self.keyframes[0]
+            for candidate in reversed(self.keyframes):
+                if candidate.tick <= tick:
+                    keyframe = candidate
+                    break
+            keyframe.restore(self.game)
+            if self.game.telemetry is not None:
+                # the recording starts with the run, one row per sim tick
+                self.game.telemetry.rewind(self.game.sim_tick)
+        while self.game.sim_tick < tick and self.game.state == "normal":
+            self.game.step((0, 0), draw=False)
+        return self.game.sim_tick
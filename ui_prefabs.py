@@ -1,11 +1,13 @@
 import pygame
+from assets import AssetManager
 from constants import *
 
 
 class MenuButton(pygame.sprite.Sprite):
     """
     an object for making mouse-interactive UI, the last button that was hovered
-    on can be checked at last_butt and used when mouse is clicked
+    on can be checked at last_butt for highlighting, clicks are hit-tested at
+    their own position with button_at
     """
     last_butt = None
     game = None
@@ -22,7 +24,7 @@ class MenuButton(pygame.sprite.Sprite):
         self.text = text
         self.color = self.def_color = color
         self.hil_color = hil_color
-        self.font = pygame.font.Font('freesansbold.ttf', 30)
+        self.font = AssetManager.get_font(30)
         self.image = self.font.render(text, True, BLACK)
         self.width = width
         self.height = height
@@ -42,6 +44,30 @@ class MenuButton(pygame.sprite.Sprite):
         else:
             self.color = self.def_color
 
+    @classmethod
+    def button_at(cls, buttons, position):
+        """
+        returns the button at a position or None, when buttons overlap the
+        one drawn last (on top) is picked
+        :param buttons: the buttons in the order they are drawn
+        :param position:
+        :return:
+        """
+        picked = None
+        for button in buttons:
+            if button.rect.collidepoint(position):
+                picked = button
+        return picked
+
+    def set_text(self, text):
+        """
+        changes the label of the button
+        :param text:
+        :return:
+        """
+        self.text = text
+        self.image = self.font.render(text, True, BLACK)
+
     @classmethod
     def load_game_rq(cls, game):
         """
@@ -106,6 +132,15 @@ class MenuTray:
                 self.display_menu_tray(self.curr_spacing)
             self.buttons.update(mouse_pos)
 
+    def shown_buttons(self):
+        """
+        returns the buttons the tray draws in its current state
+        :return:
+        """
+        if self.folded and self.curr_spacing < self.fold_spacing:
+            return []
+        return self.buttons.sprites()
+
     def display_menu_tray(self, spacing):
         """
         displays a tray at set extension
@@ -146,6 +181,144 @@ class MenuTray:
             self.folded = True
 
 
+class ListMenu:
+    """
+    a paged column of buttons for picking one of many entries, only the
+    buttons of a single page exist so long lists cost nothing to show
+    """
+
+    def __init__(self, location, width, height, rows, color, spacing=5):
+        """
+        creates the entry buttons and the page buttons below them
+        :param location:
+        :param width:
+        :param height:
+        :param rows: entries per page
+        :param color:
+        :param spacing:
+        """
+        x, y = location
+        self.rows = rows
+        self.entries = []
+        self.page = 0
+        self.open = False
+        self.buttons = [MenuButton((x, y + i * (height + spacing)), "", width,
+                                   height, color, padding=0.95)
+                        for i in range(rows)]
+        y += rows * (height + spacing)
+        self.prev_button = MenuButton((x, y), "<", 60, height, color)
+        self.next_button = MenuButton((x + width - 60, y), ">", 60, height,
+                                      color)
+
+    def show(self, entries):
+        """
+        opens the menu on its first page
+        :param entries: list of (key, label) tuples
+        :return:
+        """
+        self.entries = list(entries)
+        self.page = 0
+        self.open = True
+        self.fill_page()
+
+    def hide(self):
+        """
+        closes the menu
+        :return:
+        """
+        self.open = False
+
+    def page_count(self):
+        """
+        returns the number of pages, at least one
+        :return:
+        """
+        return max(1, -(-len(self.entries) // self.rows))
+
+    def fill_page(self):
+        """
+        puts the labels of the current page onto the buttons
+        :return:
+        """
+        for i, button in enumerate(self.buttons):
+            index = self.page * self.rows + i
+            if index < len(self.entries):
+                button.set_text(self.entries[index][1])
+            else:
+                button.set_text("")
+
+    def has(self, button):
+        """
+        checks whether a button belongs to the open menu
+        :param button:
+        :return:
+        """
+        return self.open and button is not None and (
+            button in self.buttons or button is self.prev_button or
+            button is self.next_button)
+
+    def page_keys(self):
+        """
+        returns the keys of the entries on the current page
+        :return:
+        """
+        start = self.page * self.rows
+        return [key for key, _ in self.entries[start:start + self.rows]]
+
+    def hovered(self):
+        """
+        returns the key of the entry under the mouse or None
+        :return:
+        """
+        if not self.open or MenuButton.last_butt not in self.buttons:
+            return None
+        index = self.page * self.rows + \
+            self.buttons.index(MenuButton.last_butt)
+        if index < len(self.entries):
+            return self.entries[index][0]
+        return None
+
+    def click(self, button):
+        """
+        handles a click on one of the menu's buttons, the page buttons turn
+        the page
+        :param button:
+        :return: the key of the picked entry or None
+        """
+        if button is self.prev_button:
+            self.page = (self.page - 1) % self.page_count()
+            self.fill_page()
+        elif button is self.next_button:
+            self.page = (self.page + 1) % self.page_count()
+            self.fill_page()
+        else:
+            index = self.page * self.rows + self.buttons.index(button)
+            if index < len(self.entries):
+                return self.entries[index][0]
+        return None
+
+    def shown_buttons(self):
+        """
+        returns the buttons the menu draws in its current state
+        :return:
+        """
+        if not self.open:
+            return []
+        shown = [button for button in self.buttons if button.text]
+        if self.page_count() > 1:
+            shown += [self.prev_button, self.next_button]
+        return shown
+
+    def update(self, mouse_pos):
+        """
+        draws the open menu and handles collisions with mouse
+        :param mouse_pos:
+        :return:
+        """
+        for button in self.shown_buttons():
+            button.update(mouse_pos)
+
+
 class DataDisplay(pygame.sprite.Sprite):
     """
     a simple object for printing various counters and such to the display
@@ -165,7 +338,7 @@ class DataDisplay(pygame.sprite.Sprite):
         """
         super().__init__()
         self.position = position
-        self.font = pygame.font.Font('freesansbold.ttf', 30)
+        self.font = AssetManager.get_font(30)
         self.stuff_to_display = data
         self.color = color
         self.image = self.font.render(str(self.stuff_to_display), True,